@@ -0,0 +1,109 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Times sync_all against generated in-memory repositories and writes the
+results as JSON. Run from the repository root:
+
+    python -m benchmarks.bench_sync --sizes 1000 10000 --output bench.json
+"""
+from benchmarks.memory import generate
+from tasksync.sync import plan_sync, apply_sync
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+SCENARIOS = {
+    'unchanged':{},
+    'churn':{'new':0.02, 'modified':0.05, 'deleted':0.01, 'conflicting':0.01},
+    'initial':{'new':1.0},
+}
+
+def run(size, scenario, seed):
+    """ Sync a generated execution once, returning per-phase timings. """
+    # In the initial scenario, nothing has been synced yet.
+    execution = generate(size, SCENARIOS[scenario], seed,
+            synced=scenario != 'initial')
+
+    started = time.time()
+    upstream_q, downstream_q = plan_sync(execution)
+    planned = time.time()
+    summary = apply_sync(execution, upstream_q, downstream_q)
+    applied = time.time()
+
+    batch = sum(execution[side]['repository'].batch_seconds
+            for side in ('upstream', 'downstream'))
+    return {
+        'total':applied - started,
+        'load_and_match':planned - started,
+        'copy':(applied - planned) - batch,
+        'batch':batch,
+    }, summary
+
+def measure(size, scenario, repeat, seed):
+    timings = [run(size, scenario, seed)[0] for _ in range(0, repeat)]
+    best = {k:min(t[k] for t in timings) for k in timings[0]}
+
+    tracemalloc.start()
+    _, summary = run(size, scenario, seed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'size':size,
+        'scenario':scenario,
+        'repeat':repeat,
+        'seconds':best,
+        'peak_bytes':peak,
+        'summary':summary,
+    }
+
+def main():
+    parser = argparse.ArgumentParser('bench_sync')
+    parser.add_argument('--sizes', type=int, nargs='+',
+            default=[1000, 10000, 100000])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+            default=sorted(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=3,
+            help='Timings are the best of this many runs.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for size in args.sizes:
+        for scenario in args.scenarios:
+            result = measure(size, scenario, args.repeat, args.seed)
+            results.append(result)
+            sys.stderr.write("%7d %-10s %8.3fs %10d bytes\n" % (size, scenario,
+                result['seconds']['total'], result['peak_bytes']))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'results':results,
+        }, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
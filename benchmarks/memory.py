@@ -0,0 +1,169 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+In-memory repositories holding real GoogleTask and TaskWarriorTask sources,
+and a generator of synced repositories with controlled churn.
+"""
+from tasksync.google_tasks import GoogleTaskFactory
+from tasksync.task import TaskRepository
+from tasksync.taskwarrior import TaskWarriorTaskFactory
+
+from datetime import datetime, timedelta
+
+import itertools
+import random
+import time
+
+class MemoryTaskRepository(TaskRepository):
+    """
+    Keeps task sources in a dict. Writes assign ids and etags the way the
+    real providers do, and the time spent closing batches is accumulated
+    in 'batch_seconds'.
+    """
+
+    def __init__(self, create):
+        self._create = create
+        self._ids = itertools.count()
+        self.sources = {}
+        self.batch_seconds = 0.0
+        self.writes = 0
+
+    def all(self):
+        return [self._create(s) for s in self.sources.values()]
+
+    def get(self, uids):
+        return [self._create(self.sources[u]) for u in uids if u in self.sources]
+
+    def batch_open(self):
+        return []
+
+    def batch_close(self, batch):
+        started = time.time()
+        for (action, task, cb, userdata) in batch:
+            self.writes += 1
+            if action == 'delete':
+                self.sources.pop(task.uid, None)
+                continue
+            self._assign(task._source)
+            self.sources[task.uid] = task._source
+            if not cb is None:
+                cb(task, userdata)
+        self.batch_seconds += time.time() - started
+
+    def save(self, task, batch, cb, userdata):
+        batch.append(('save', task, cb, userdata))
+
+    def delete(self, task, batch, cb, userdata):
+        batch.append(('delete', task, cb, userdata))
+
+    def _assign(self, source):
+        raise NotImplementedError
+
+class MemoryGoogleTaskRepository(MemoryTaskRepository):
+    def __init__(self):
+        factory = GoogleTaskFactory()
+        super(MemoryGoogleTaskRepository, self).__init__(
+                lambda s: factory.create_from('@default', map=s))
+        self.factory = factory
+
+    def _assign(self, source):
+        source.setdefault('id', 'g%d' % next(self._ids))
+        source['etag'] = 'e%d' % next(self._ids)
+
+class MemoryTaskWarriorTaskRepository(MemoryTaskRepository):
+    def __init__(self):
+        factory = TaskWarriorTaskFactory()
+        super(MemoryTaskWarriorTaskRepository, self).__init__(
+                lambda s: factory.create_from(map=s))
+        self.factory = factory
+
+    def _assign(self, source):
+        source.setdefault('uuid', 't%d' % next(self._ids))
+
+def generate(size, churn, seed=0, synced=True):
+    """
+    Build an execution of 'size' synced task pairs, then apply churn: a dict
+    of the fraction of pairs that are 'new' (on either side), 'modified'
+    (on either side), 'deleted' upstream or 'conflicting' (modified on
+    both sides). When not 'synced', no pairs are built and only the new
+    tasks exist.
+    """
+    rng = random.Random(seed)
+    upstream = MemoryGoogleTaskRepository()
+    downstream = MemoryTaskWarriorTaskRepository()
+
+    due = datetime(2018, 1, 1)
+    for i in range(0, size if synced else 0):
+        source = {
+            'id':'g%d' % i,
+            'etag':'e%d' % i,
+            'title':'Task %d' % i,
+            'status':'needsAction',
+        }
+        if rng.random() < 0.5:
+            source['due'] = (due + timedelta(days=rng.randint(0, 365)))\
+                    .strftime('%Y-%m-%dT00:00:00.000Z')
+        upstream.sources[source['id']] = source
+        dtask = downstream.factory.create_from(
+                other=upstream.factory.create_from(map=source))
+        dtask._source['uuid'] = 't%d' % i
+        downstream.sources[dtask.uid] = dtask._source
+
+    pairs = list(zip(sorted(upstream.sources), sorted(downstream.sources)))
+    rng.shuffle(pairs)
+    pick = lambda kind: [pairs.pop() for _ in range(
+        0, min(len(pairs), int(size * churn.get(kind, 0.0))))]
+
+    modified = pick('modified')
+    for (uid, _) in modified[0::2]:
+        upstream.sources[uid]['title'] += ' (upstream)'
+        upstream.sources[uid]['etag'] += 'm'
+    for (_, did) in modified[1::2]:
+        downstream.sources[did]['description'] += ' (downstream)'
+    for (uid, did) in pick('conflicting'):
+        upstream.sources[uid]['title'] += ' (upstream)'
+        upstream.sources[uid]['etag'] += 'm'
+        downstream.sources[did]['description'] += ' (downstream)'
+    for (uid, _) in pick('deleted'):
+        del upstream.sources[uid]
+
+    new = int(size * churn.get('new', 0.0))
+    for i in range(0, new // 2):
+        uid = 'n%d' % i
+        upstream.sources[uid] = {'id':uid, 'etag':uid, 'title':'New %d' % i,
+                'status':'needsAction'}
+    for i in range(0, new - new // 2):
+        did = 'm%d' % i
+        downstream.sources[did] = {'uuid':did, 'description':'New %d' % i,
+                'status':'pending'}
+
+    return {
+        'upstream':{
+            'factory':upstream.factory,
+            'repository':upstream,
+            'filter':None,
+            'cb':None,
+            'delete_orphans':True,
+        },
+        'downstream':{
+            'factory':downstream.factory,
+            'repository':downstream,
+            'filter':None,
+            'cb':None,
+            'delete_orphans':True,
+        },
+    }
@@ -12,6 +12,7 @@ setup(
         packages=find_packages(),
 
         include_package_data=True,
+        package_data={'tasksync':['discovery/*.json', 'hooks/*.tasksync']},
         zip_safe=False,
 
         install_requires=[
@@ -1,15 +1,36 @@
 from tasksync.config import executions
-from tasksync.sync import sync_all
+from tasksync.daemon import Daemon
+from tasksync.plan import describe, dump, format_report, load, restore
+from tasksync.scheduler import format_results, run_all
+from tasksync.sync import plan_sync, apply_sync
 
 import argparse
 import logging
 import oauth2client.tools
+import sys
 
 logger = logging.getLogger(__name__)
 
 def main():
     parser = argparse.ArgumentParser('tasksync', parents=[oauth2client.tools.argparser])
+    parser.add_argument('command', nargs='?', choices=['sync', 'daemon'],
+            default='sync', help='Sync once, or keep running and sync on change.')
     parser.add_argument('--debug', action='store_true', default=False, help='Enable debugging.')
+    parser.add_argument('--plan', metavar='FILE', default=None,
+            help='Print what would be synced, and its cost, without writing. '
+                 'The plan is saved to FILE for --apply-plan.')
+    parser.add_argument('--apply-plan', metavar='FILE', default=None,
+            help='Make exactly the writes of a plan saved by --plan.')
+    parser.add_argument('--jobs', type=int, default=1,
+            help='Run up to this many executions at the same time. Executions '
+                 'sharing a TaskWarrior database still run one at a time.')
+    parser.add_argument('--poll-min', type=float, default=60.0,
+            help='In daemon mode, the shortest time between polls, in seconds.')
+    parser.add_argument('--poll-max', type=float, default=900.0,
+            help='In daemon mode, the longest time between polls, in seconds.')
+    parser.add_argument('--debounce', type=float, default=2.0,
+            help='In daemon mode, wait for changes to stop for this long, '
+                 'in seconds, before syncing.')
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO)
@@ -19,9 +40,28 @@ def main():
 
 
     runbook = executions(args)
-    for p in runbook:
-        logger.info("Running - %s.", p)
-        sync_all(runbook[p])
+    if args.command == 'daemon':
+        Daemon(runbook, jobs=args.jobs, poll_min=args.poll_min,
+                poll_max=args.poll_max, debounce=args.debounce).run_forever()
+    elif not args.plan is None:
+        reports = {}
+        for p in runbook:
+            logger.info("Planning - %s.", p)
+            reports[p] = describe(runbook[p], *plan_sync(runbook[p]))
+            print(format_report(p, reports[p]))
+        with open(args.plan, 'w') as f:
+            dump(reports, f)
+    elif not args.apply_plan is None:
+        with open(args.apply_plan) as f:
+            reports = load(f)
+        for p in reports:
+            logger.info("Applying plan - %s.", p)
+            apply_sync(runbook[p], *restore(runbook[p], reports[p]))
+    else:
+        results = run_all(runbook, jobs=args.jobs)
+        logger.info("Results:\n%s", format_results(results))
+        if any(r['status'] != 'ok' for r in results.values()):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
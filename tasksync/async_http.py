@@ -0,0 +1,166 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A minimal HTTP/1.1 client over asyncio streams, with just what the Google
+Tasks API needs: keep-alive connections, a bound on the requests in
+flight, and fixed-length, chunked or compressed responses.
+"""
+from urllib.parse import urlsplit
+
+import asyncio
+import gzip
+import logging
+import ssl
+import zlib
+
+logger = logging.getLogger(__name__)
+
+class AsyncHttp(object):
+    """
+    Sends up to 'max_connections' requests at the same time, each over its
+    own connection. Connections are kept open and reused for later requests
+    to the same host, so long as the server allows it. With a 'transfer'
+    (a tasksync.transfer.Transfer), the bytes sent and received are counted.
+    """
+
+    def __init__(self, max_connections=4, timeout=60, transfer=None):
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._loop = None
+        self._slots = None
+        self._idle = {}
+        self._transfer = transfer
+        self.stats = {'requests':0, 'connections':0}
+
+    async def request(self, method, uri, headers=None, body=None):
+        """
+        Send a request, returning its status, its headers, with lower-case
+        names, and its (decoded) content.
+        """
+        self.__bind()
+        url = urlsplit(uri)
+        origin = (url.scheme, url.hostname,
+                url.port or (443 if url.scheme == 'https' else 80))
+        target = url.path or '/'
+        if url.query:
+            target += '?' + url.query
+        lines = ['%s %s HTTP/1.1' % (method, target), 'Host: %s' % url.netloc]
+        lines += ['%s: %s' % (k, v) for k, v in (headers or {}).items()
+                if k.lower() not in ('host', 'content-length', 'connection')]
+        if body is None:
+            body = b''
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        if len(body) > 0 or method in ('POST', 'PUT', 'PATCH'):
+            lines.append('Content-Length: %d' % len(body))
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        async with self._slots:
+            self.stats['requests'] += 1
+            return await asyncio.wait_for(
+                    self.__send(origin, method, message), self._timeout)
+
+    async def close(self):
+        """ Close the idle connections. """
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for (_, writer) in connections:
+                writer.close()
+
+    def __bind(self):
+        """ Connections and limits belong to the loop they were made in. """
+        loop = asyncio.get_running_loop()
+        if not self._loop is loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self._max_connections)
+            self._idle = {}
+
+    async def __send(self, origin, method, message):
+        idle = self._idle.setdefault(origin, [])
+        while len(idle) > 0:
+            # The server may have closed an idle connection in the meantime.
+            connection = idle.pop()
+            try:
+                return await self.__exchange(origin, connection, method, message)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+        return await self.__exchange(origin, await self.__connect(origin),
+                method, message)
+
+    async def __connect(self, origin):
+        scheme, host, port = origin
+        logger.debug("Connecting to %s:%d.", host, port)
+        self.stats['connections'] += 1
+        context = ssl.create_default_context() if scheme == 'https' else None
+        return await asyncio.open_connection(host, port, ssl=context)
+
+    async def __exchange(self, origin, connection, method, message):
+        reader, writer = connection
+        writer.write(message)
+        await writer.drain()
+
+        status_line = await reader.readuntil(b'\r\n')
+        received = len(status_line)
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            received += len(line)
+            if line == b'\r\n':
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+        status = int(status)
+        keep_alive = headers.get('connection', '').lower() != 'close'\
+                and version != 'HTTP/1.0'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self.__read_chunks(reader)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        if not self._transfer is None:
+            self._transfer.add(sent=len(message), received=received + len(content))
+
+        encoding = headers.get('content-encoding', '').lower()
+        if encoding == 'gzip':
+            content = gzip.decompress(content)
+        elif encoding == 'deflate':
+            content = zlib.decompress(content)
+
+        if keep_alive:
+            self._idle.setdefault(origin, []).append(connection)
+        else:
+            writer.close()
+        return status, headers, content
+
+    async def __read_chunks(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                # Skip any trailers.
+                while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
@@ -0,0 +1,115 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A journal of a sync in progress: its plan, then each write as its batch
+lands, so that an interrupted sync can be finished rather than redone.
+"""
+from datetime import datetime
+
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# A planned action's dest was saved, its source had the new association
+# written back, or its dest was deleted.
+EVENTS = ('saved', 'linked', 'deleted')
+
+class Checkpoint(object):
+    """
+    One JSON object per line: first the plan, as described by plan.describe,
+    then an outcome for each write, naming the action by its direction and
+    position in the plan. The file only exists while a sync is unfinished.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def begin(self, report, started=None):
+        """ Start recording the sync of a described plan. """
+        header = {'plan':report, 'started':None if started is None
+                else started.strftime(_DATE_FORMAT)}
+        temp = self._path + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(json.dumps(header, sort_keys=True) + '\n')
+        # The previous checkpoint is only replaced once this one is whole.
+        os.rename(temp, self._path)
+        self._file = open(self._path, 'a')
+
+    def outcome(self, direction, index, event, uid=None):
+        """ Record that a write of a planned action landed. """
+        line = json.dumps({'direction':direction, 'index':index,
+            'event':event, 'uid':uid}, sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def finish(self):
+        """ The sync completed; nothing is left to resume. """
+        if not self._file is None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+    def pending(self):
+        """
+        Identifies an unfinished sync. Returns None, or when it started, the
+        plan of what is left of it, and the (downstream uid, upstream uid)
+        pairs of upstream tasks created from downstream tasks that never
+        had the association written back.
+        """
+        try:
+            with open(self._path) as f:
+                lines = f.read().split('\n')
+        except IOError:
+            return None
+
+        # The last line is either empty or was cut short.
+        records = [json.loads(l) for l in lines[:-1] if len(l.strip()) > 0]
+        if len(records) == 0:
+            return None
+        header, outcomes = records[0], records[1:]
+
+        events = {}
+        for o in outcomes:
+            events.setdefault((o['direction'], o['index']), {})[o['event']] = o['uid']
+
+        started = header['started']
+        if not started is None:
+            started = datetime.strptime(started, _DATE_FORMAT)
+
+        report = {}
+        unlinked = []
+        for direction in ('downstream', 'upstream'):
+            actions = header['plan'][direction]['actions']
+            remaining = []
+            for index, action in enumerate(actions):
+                done = events.get((direction, index), {})
+                if 'saved' in done and direction == 'upstream'\
+                        and action['action'] == 'create' and not 'linked' in done:
+                    unlinked.append((action['source'], done['saved']))
+                if not 'saved' in done and not 'deleted' in done:
+                    remaining.append(action)
+            report[direction] = {'actions':remaining}
+        return started, report, unlinked
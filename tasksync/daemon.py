@@ -0,0 +1,152 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Keeps a runbook's repositories open and syncs its executions when their
+watched files change, or otherwise on an interval that grows while
+nothing changes.
+"""
+from tasksync.scheduler import run_all
+from tasksync.sync import sync_all
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class FileWatcher(object):
+    """ Notices changes to files by comparing their size and mtime. """
+
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._snapshot = self.__stat()
+
+    def changed(self):
+        """ Identifies if any file changed since the last call. """
+        snapshot = self.__stat()
+        changed = snapshot != self._snapshot
+        self._snapshot = snapshot
+        return changed
+
+    def __stat(self):
+        snapshot = []
+        for path in self._paths:
+            try:
+                stat = os.stat(path)
+                snapshot.append((stat.st_mtime, stat.st_size))
+            except OSError:
+                snapshot.append(None)
+        return snapshot
+
+class AdaptiveInterval(object):
+    """ An interval that grows by 'factor' up to 'maximum' while idle. """
+
+    def __init__(self, minimum, maximum, factor=2.0):
+        self._minimum = minimum
+        self._maximum = maximum
+        self._factor = factor
+        self.current = minimum
+
+    def reset(self):
+        self.current = self._minimum
+
+    def backoff(self):
+        self.current = min(self._maximum, self.current * self._factor)
+
+class Daemon(object):
+    def __init__(self, runbook, jobs=1, run=sync_all, poll_min=60.0,
+            poll_max=900.0, debounce=2.0, max_delay=30.0, tick=1.0,
+            clock=time.time, sleep=time.sleep):
+        """
+        Every execution is synced at start. After that, an execution is
+        synced 'debounce' seconds after its watched files stop changing,
+        but no later than 'max_delay' seconds after the first change, so
+        that a burst of edits makes one sync. Executions are also synced
+        every 'poll_min' seconds, backing off to 'poll_max' while syncs
+        write nothing, to pick up changes that can't be watched.
+        """
+        self._runbook = runbook
+        self._jobs = jobs
+        self._run = run
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._tick = tick
+        self._clock = clock
+        self._sleep = sleep
+
+        now = clock()
+        self._watchers = {n:FileWatcher(_watched_paths(runbook[n]))
+                for n in runbook}
+        self._intervals = {n:AdaptiveInterval(poll_min, poll_max)
+                for n in runbook}
+        self._next_poll = {n:now for n in runbook}
+        self._changed = {}
+
+    def step(self):
+        """
+        Run the executions that are due. Returns their results, by name, as
+        returned by run_all.
+        """
+        now = self._clock()
+        for name in self._runbook:
+            if self._watchers[name].changed():
+                first, _ = self._changed.get(name, (now, None))
+                due = min(now + self._debounce, first + self._max_delay)
+                self._changed[name] = (first, due)
+
+        due = [n for n in self._runbook
+                if self._next_poll[n] <= now
+                or (n in self._changed and self._changed[n][1] <= now)]
+        if len(due) == 0:
+            return {}
+
+        logger.debug("Syncing %s.", ", ".join(due))
+        results = run_all({n:self._runbook[n] for n in due},
+                jobs=self._jobs, run=self._run)
+
+        # The sync's own writes change the watched files too. That causes
+        # one more sync, which finds nothing to write.
+        now = self._clock()
+        for name in due:
+            self._changed.pop(name, None)
+            interval = self._intervals[name]
+            if _wrote(results[name]):
+                interval.reset()
+            else:
+                interval.backoff()
+            self._next_poll[name] = now + interval.current
+        return results
+
+    def run_forever(self):
+        logger.info("Watching %d executions.", len(self._runbook))
+        try:
+            while True:
+                self.step()
+                self._sleep(self._tick)
+        except KeyboardInterrupt:
+            logger.info("Stopping.")
+
+def _watched_paths(execution):
+    return [p for side in ('upstream', 'downstream')
+            for p in execution[side]['repository'].watched_paths()]
+
+def _wrote(result):
+    summary = result['summary']
+    if result['status'] != 'ok' or summary is None:
+        return False
+    return any(counts['saved'] + counts['deleted'] > 0
+            for counts in summary.values())
@@ -0,0 +1,95 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The date forms used by TaskWarrior and Google Tasks. Every date is a naive
+datetime in UTC. Parsing and formatting are memoized, as the same due
+dates recur across many tasks and are compared on every sync.
+"""
+from datetime import datetime, timedelta, timezone
+
+import calendar
+import functools
+
+TASKWARRIOR_FORMAT = '%Y%m%dT%H%M%SZ'
+GOOGLE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# The distinct dates remembered by each conversion.
+CACHE_SIZE = 4096
+
+_EPOCH = datetime(1970, 1, 1)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_taskwarrior(value):
+    """
+    Parse a TaskWarrior date: either seconds since the epoch, as kept in its
+    data files, or YYYYMMDDTHHMMSSZ, as exported.
+    """
+    if value.isdigit():
+        return _EPOCH + timedelta(seconds=int(value))
+    if len(value) == 16 and value[8] == 'T' and value[15] == 'Z':
+        try:
+            return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                    int(value[9:11]), int(value[11:13]), int(value[13:15]))
+        except ValueError:
+            pass
+    # Let strptime explain what is wrong with it.
+    return datetime.strptime(value, TASKWARRIOR_FORMAT)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def format_taskwarrior(value):
+    """ Format a date as TaskWarrior stores it: seconds since the epoch. """
+    return str(calendar.timegm(_utc(value).timetuple()))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def format_taskwarrior_iso(value):
+    """
+    Format a date, or a TaskWarrior date string, as YYYYMMDDTHHMMSSZ, the
+    only form `task import` and filters understand.
+    """
+    if isinstance(value, str):
+        if not value.isdigit():
+            return value
+        value = parse_taskwarrior(value)
+    value = _utc(value)
+    return '%04d%02d%02dT%02d%02d%02dZ' % (value.year, value.month, value.day,
+            value.hour, value.minute, value.second)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_google(value):
+    """ Parse an RFC 3339 date, in UTC, as Google Tasks reports them. """
+    if len(value) == 24 and value[4] == '-' and value[7] == '-'\
+            and value[10] == 'T' and value[19] == '.' and value[23] == 'Z':
+        try:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                    int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                    int(value[20:23]) * 1000)
+        except ValueError:
+            pass
+    return datetime.strptime(value, GOOGLE_FORMAT)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def format_google(value):
+    """ Format a date as Google Tasks accepts it, to the second. """
+    value = _utc(value)
+    return '%04d-%02d-%02dT%02d:%02d:%02d.000Z' % (value.year, value.month,
+            value.day, value.hour, value.minute, value.second)
+
+def _utc(value):
+    """ Naive dates are taken to be UTC already; others are converted. """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -14,23 +14,57 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+from tasksync import dates
+from tasksync.async_http import AsyncHttp
+from tasksync.retry import AdaptiveLimit, backoff, is_retriable, is_throttled, retry_after
 from tasksync.task import Task, UpstreamTask, TaskFactory, TaskRepository
-
-from apiclient import discovery, http
-from datetime import datetime
+from tasksync.task_list_cache import TaskListCache
+from tasksync.transfer import CountingHttp, Transfer
+
+from apiclient import discovery
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, set_user_agent
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser, Parser
 from oauth2client.file import Storage
+from urllib.parse import urlsplit
 
 import argparse
+import asyncio
 import httplib2
+import json
 import logging
 import oauth2client
 import oauth2client.tools
+import os
+import queue
+import threading
+import time
+import uuid
 
 
 logger = logging.getLogger(__name__)
 
+# Google only gzips responses for clients that say so in their User-Agent.
+USER_AGENT = 'tasksync/1.0 (gzip)'
+
+# The only fields of a task that a sync reads; responses are cut down to these.
+TASK_FIELDS = 'id,etag,title,status,due,completed,updated,deleted'
+
+DISCOVERY_DOCUMENT = os.path.join(os.path.dirname(__file__), 'discovery',
+        'tasks.v1.json')
+
+def discovery_document():
+    """ The shipped discovery document of the Tasks v1 API. """
+    with open(DISCOVERY_DOCUMENT) as f:
+        return json.load(f)
+
 class GoogleTask(Task, UpstreamTask):
-    """ Implementation for Google Tasks. """
+    """
+    Implementation for Google Tasks. The fingerprint is kept until the task
+    changes through copy_from or its _source is replaced.
+    """
+    __slots__ = ('__source', 'list_name', '_fingerprint')
 
     def __init__(self, source, list_name):
         if list_name is None:
@@ -45,7 +79,9 @@ class GoogleTask(Task, UpstreamTask):
                 'GoogleTask', self.uid, self.list_name, self.subject)
 
     def should_sync(self):
-        return True
+        # A deleted task is only reported by incremental loads. Skipping it
+        # leaves its downstream counterpart to be handled as an orphan.
+        return not self.is_deleted
 
     def should_sync_with(self, other):
         return True
@@ -63,6 +99,7 @@ class GoogleTask(Task, UpstreamTask):
 
         if other.is_completed:
             self._source['status'] = 'completed'
+        self._fingerprint = None
 
     @property
     def provider(self):
@@ -78,6 +115,8 @@ class GoogleTask(Task, UpstreamTask):
 
     @property
     def status(self):
+        if self._source.get('deleted', False):
+            return 'deleted'
         status = self._source['status']
         if status  == 'needsAction':
             return 'pending'
@@ -90,6 +129,15 @@ class GoogleTask(Task, UpstreamTask):
     def subject(self):
         return self._source.get('title', None)
 
+    @property
+    def _source(self):
+        return self.__source
+
+    @_source.setter
+    def _source(self, source):
+        self.__source = source
+        self._fingerprint = None
+
     @property
     def due(self):
         return self.__parse_date(self._source.get('due', None))
@@ -98,17 +146,23 @@ class GoogleTask(Task, UpstreamTask):
     def completed(self):
         return self.__parse_date(self._source.get('completed', None))
 
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = super(GoogleTask, self).fingerprint
+        return self._fingerprint
+
 
     def __parse_date(self, as_string):
         #pylint: disable=R0201,C0111
         """ Parse the specified date. """
         if as_string is None:
             return None
-        return datetime.strptime(as_string, '%Y-%m-%dT%H:%M:%S.%fZ')
+        return dates.parse_google(as_string)
 
     def __format_date(self, iso_date):
         #pylint: disable=R0201,C0111
-        return datetime.strftime(iso_date, '%Y-%m-%dT%H:%M:%S.000Z')
+        return dates.format_google(iso_date)
 
     def __set_or_delete(self, key, value, fmt=None):
         if value is None:
@@ -127,7 +181,10 @@ class GoogleTaskFactory(TaskFactory):
         new instance.
         """
         if 'map' in kwargs:
-            return GoogleTask(kwargs['map'].copy(), list_name)
+            # A caller handing over a map it won't use again may skip the copy.
+            source = kwargs['map']
+            return GoogleTask(source.copy() if kwargs.get('copy', True)
+                    else source, list_name)
         elif 'other' in kwargs:
             return self._create_from_other(kwargs['other'], list_name)
         else:
@@ -143,63 +200,534 @@ class GoogleTaskFactory(TaskFactory):
         return task
 
 class GoogleTaskRepository(TaskRepository):
-    def __init__(self, factory, flags, client=None, **kwargs):
+    # The largest page the API will return.
+    __PAGE_SIZE = 100
+
+    __PAGE_FIELDS = 'items(%s),nextPageToken' % TASK_FIELDS
+    __LIST_PAGE_FIELDS = 'etag,items(id,title),nextPageToken'
+
+    # Fields cleared on a task are sent as null, or a patch would keep them.
+    __CLEARABLE = ('due', 'completed')
+
+    def __init__(self, factory, flags, client=None, concurrency=1,
+            batch_size=50, pipeline=0, max_retries=5, task_list_cache=None,
+            task_list_ttl=86400, **kwargs):
+        """
+        Up to 'concurrency' task lists are fetched at the same time. With
+        the default, one, lists are fetched one after another.
+
+        Writes are sent in batches of at most 'batch_size' requests, each
+        sent as soon as it fills. With a 'pipeline' above zero, up to that
+        many full batches are sent in the background while the next fills.
+
+        Requests that are throttled or fail with a server error are retried
+        in a later batch, up to 'max_retries' times, after a growing wait.
+        Batches shrink, and fewer are sent at the same time, while requests
+        are being throttled, and grow back as they succeed.
+
+        With a 'quota' (a tasksync.quota.Quota), every call waits for, and
+        counts against, that quota.
+
+        Only TASK_FIELDS are requested, and changes are sent as patches, so
+        that fields a sync doesn't read, like notes, are left as they are.
+
+        The async variants, all_async and batch_open_async/batch_close_async,
+        send at most the greater of 'concurrency' and 'pipeline' requests at
+        the same time.
+
+        Task lists are listed once and trusted for 'task_list_ttl' seconds,
+        across runs when kept in the 'task_list_cache' file. After that,
+        they're only listed again if their etag changed. A list that can't
+        be found, by title or by id, has them listed again first.
+        """
         self._factory = factory
-        self._client = client or ApiClient(flags, **kwargs)
-        self._task_lists = self.__load_task_lists(kwargs['task_list_filter'])
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._batch_limit = AdaptiveLimit(batch_size)
+        self._max_retries = max_retries
+        self._sleep = time.sleep
+        self._async_sleep = asyncio.sleep
+        self._clock = time.time
+        self._pipeline = None
+        self._pipeline_limit = None
+        if pipeline > 0:
+            self._pipeline = ThreadPoolExecutor(max_workers=pipeline)
+            self._pipeline_limit = AdaptiveLimit(pipeline)
+        self.__client = client
+        self.__client_args = (flags, dict(kwargs, max_retries=max_retries))
+        self.__async_client = None
+        self.__async_connections = max(1, concurrency, pipeline)
+        self._quota = kwargs.get('quota', None)
+        self.__task_lists = None
+        self.__task_lists_expiry = None
+        self.__task_lists_fetched = False
+        self.__task_lists_lock = threading.RLock()
+        self.__task_list_filter = kwargs['task_list_filter']
+        self.__directory = None
+        self._task_list_ttl = task_list_ttl
+        self._task_list_cache = None
+        if not task_list_cache is None:
+            self._task_list_cache = TaskListCache(task_list_cache)
+
+    @property
+    def _client(self):
+        """ The API client, which is only set up once it's first used. """
+        if self.__client is None:
+            flags, kwargs = self.__client_args
+            self.__client = ApiClient(flags, **kwargs)
+        return self.__client
+
+    @property
+    def _async_client(self):
+        """ The asyncio client, sharing the API client's credentials. """
+        if self.__async_client is None:
+            client = self._client
+            self.__async_client = AsyncApiClient(client.root_url,
+                    credentials=client.credentials,
+                    max_connections=self.__async_connections,
+                    max_retries=self._max_retries, quota=self._quota,
+                    transfer=client.transfer)
+        return self.__async_client
+
+    @property
+    def _task_lists(self):
+        """
+        Task list ids by title, loaded when first needed and revalidated
+        once they're older than the ttl.
+        """
+        with self.__task_lists_lock:
+            if self.__task_lists is None or (not self.__task_lists_expiry is None
+                    and self._clock() >= self.__task_lists_expiry):
+                self.__task_lists = self.__load_task_lists(
+                        self.__task_list_filter)
+            return self.__task_lists
+
+    @_task_lists.setter
+    def _task_lists(self, task_lists):
+        """ Use these task lists, which never expire. """
+        with self.__task_lists_lock:
+            self.__task_lists = task_lists
+            self.__task_lists_expiry = None
+
+    def estimate(self, saves, deletes):
+        # Every request in a batch counts as a call against the quota.
+        requests = saves + deletes
+        batches = (requests + self._batch_size - 1) // self._batch_size
+        return {'api_calls':requests, 'subprocesses':0, 'batches':batches}
+
+    @property
+    def quota(self):
+        return self._quota
+
+    def synced(self):
+        if self.__client is None:
+            return
+        sent, received = self._client.transfer.reset()
+        logger.info("Sent %d bytes to and received %d bytes from Google.",
+                sent, received)
 
     def batch_open(self):
-        return {'count':0, 'batch':http.BatchHttpRequest()}
+        return {'count':0, 'batch':self._client.new_batch(), 'flushing':[]}
 
     def batch_close(self, batch):
-        if batch['count'] > 0:
-            self._client.execute(batch['batch'])
+        self.__flush(batch)
+        self.__wait(batch)
+        self.__retry(batch)
+
+    def batch_open_async(self):
+        """ Open a batch to be sent by batch_close_async. """
+        return {'count':0, 'batch':AsyncBatch(), 'sending':[]}
+
+    async def batch_close_async(self, batch):
+        """
+        Send what is left of a batch opened by batch_open_async. Batches
+        filled while an event loop runs are sent as soon as they fill, the
+        rest when the batch is closed.
+        """
+        self.__flush(batch)
+        await self.__sent(batch)
+        while len(batch.get('retries', [])) > 0:
+            retries = sorted(batch.pop('retries'), key=lambda r: r[0])
+            await self._async_sleep(max(0, retries[0][0] - self._clock()))
+            now = self._clock()
+            logger.debug("Retrying %d requests.", len(retries))
+            for retry in retries:
+                if retry[0] > now:
+                    batch.setdefault('retries', []).append(retry)
+                else:
+                    self.__add(batch, retry[1], retry[2], attempt=retry[3])
+            self.__flush(batch)
+            await self.__sent(batch)
 
     def all(self):
+        return self.__list_all()
+
+    async def all_async(self):
+        """
+        Load all tasks, as all does, without blocking the event loop. Every
+        list is fetched at the same time.
+        """
+        # Task lists are usually cached, so they're loaded by the blocking
+        # client, off the loop.
+        loop = asyncio.get_running_loop()
+        task_lists = list((await loop.run_in_executor(None,
+            lambda: self._task_lists)).keys())
+        loaded = await asyncio.gather(
+                *[self.__list_pages_async(t) for t in task_lists])
+        return [task for tasks in loaded for task in tasks]
+
+    def modified_since(self, since):
+        updated_min = dates.format_google(since)
+        return self.__list_all(updatedMin=updated_min,
+                showDeleted=True, showHidden=True)
+
+    def get(self, uids):
+        # A task can only be fetched through its list, which isn't known
+        # here: ask each list in turn for the tasks not yet found.
+        remaining = set(uids)
         tasks = []
         for task_list in self._task_lists.keys():
-            logger.debug("Retrieving tasks for %s.", task_list)
-
-            method = lambda s: s.list(tasklist=self._task_lists[task_list])
-            upstream_tasks = self._client.tasks(method)
-            upstream_tasks = self._client.execute(upstream_tasks)
-            if 'items' in upstream_tasks:
-                tasks += [self._factory.create_from(task_list, map=t)
-                        for t in upstream_tasks['items']
-                        if t['title'] != '']
+            if len(remaining) == 0:
+                break
+
+            found = []
+            def found_cb(task_list):
+                def impl(request_id, response, exception):
+                    if exception is None:
+                        found.append(self._factory.create_from(task_list,
+                            map=response, copy=False))
+                return impl
+
+            batch = {'count':0, 'batch':self._client.new_batch()}
+            for uid in remaining:
+                method = lambda s: s.get(tasklist=self._task_lists[task_list],
+                        task=uid, fields=TASK_FIELDS)
+                self.__add(batch, self._client.tasks(method),
+                        found_cb(task_list))
+            self.__flush(batch)
+            self.__retry(batch)
+
+            remaining.difference_update(t.uid for t in found)
+            tasks += found
         return tasks
 
     def delete(self, gtask, batch, cb, userdata):
-        tasklist = self._task_lists[gtask.list_name]
-        def method(service):
-            action = service.delete(task=gtask.uid, tasklist=tasklist)
-            batch['count'] += 1
-            batch['batch'].add(action,
-                    callback=self.__batch_cb(gtask, userdata, cb))
-        self._client.tasks(method)
+        tasklist = self.__task_list_id(gtask.list_name)
+        action = self._client.tasks(
+                lambda s: s.delete(task=gtask.uid, tasklist=tasklist))
+        self.__add(batch, action, self.__batch_cb(gtask, userdata, cb))
 
     def save(self, gtask, batch, cb, userdata):
-        tasklist = self._task_lists.get(gtask.list_name, '@default')
+        tasklist = self.__task_list_id(gtask.list_name, '@default')
         def method(service):
             action = None
             if gtask.uid is None:
-                action = service.insert(tasklist=tasklist, body=gtask._source)
+                action = service.insert(tasklist=tasklist, body=gtask._source,
+                        fields=TASK_FIELDS)
             else:
-                action = service.update(tasklist=tasklist, body=gtask._source,
-                        task=gtask.uid)
+                body = dict(gtask._source)
+                for key in GoogleTaskRepository.__CLEARABLE:
+                    body.setdefault(key, None)
+                action = service.patch(tasklist=tasklist, body=body,
+                        task=gtask.uid, fields=TASK_FIELDS)
             return action
 
         action = self._client.tasks(method)
+        self.__add(batch, action, self.__batch_cb(gtask, userdata, cb))
+
+    def __add(self, batch, action, callback, attempt=0):
+        """
+        Queue a request in the batch. A request that fails, but may succeed
+        later, is queued for retry rather than reported to the callback.
+        """
+        outcome = batch.setdefault('outcome', {'throttled':False})
+        def impl(request_id, response, exception):
+            if (not exception is None and attempt < self._max_retries
+                    and is_retriable(exception)):
+                if is_throttled(exception):
+                    outcome['throttled'] = True
+                delay = backoff(attempt, retry_after(exception))
+                batch.setdefault('retries', []).append(
+                        (self._clock() + delay, action, callback, attempt + 1))
+                return
+            callback(request_id, response, exception)
+
+        batch['batch'].add(action, callback=impl)
         batch['count'] += 1
-        batch['batch'].add(action,
-                callback=self.__batch_cb(gtask, userdata, cb))
+        if batch['count'] >= min(self._batch_size, self._batch_limit.value):
+            self.__flush(batch, pipeline=True)
+
+    def __flush(self, batch, pipeline=False):
+        """ Send the requests queued in the batch and start a new batch. """
+        if batch['count'] < 1:
+            return
+        logger.debug("Sending batch of %d requests.", batch['count'])
+        full = batch['batch']
+        outcome = batch.pop('outcome', {'throttled':False})
+        calls = batch['count']
+        batch['count'] = 0
+        if 'sending' in batch:
+            batch['batch'] = AsyncBatch()
+            sending = self.__execute_async(full, calls, outcome)
+            try:
+                sending = asyncio.get_running_loop().create_task(sending)
+            except RuntimeError:
+                # Without a running loop, it can only be sent once closed.
+                pass
+            batch['sending'].append(sending)
+            return
+        batch['batch'] = self._client.new_batch()
+        if pipeline and not self._pipeline is None:
+            flushing = batch['flushing']
+            while (len([f for f in flushing if not f.done()])
+                    >= self._pipeline_limit.value):
+                # Too many batches are being sent already.
+                next(f for f in flushing if not f.done()).result()
+            flushing.append(self._pipeline.submit(
+                self.__execute, full, calls, outcome))
+        else:
+            self.__execute(full, calls, outcome)
+
+    def __execute(self, full, calls, outcome):
+        # Each request in a batch counts against the quota.
+        self._client.acquire(calls)
+        self._client.execute(full)
+        self.__adapt(outcome)
+
+    async def __execute_async(self, full, calls, outcome):
+        await self._async_client.acquire(calls)
+        await self._async_client.execute_batch(full)
+        self.__adapt(outcome)
+
+    def __adapt(self, outcome):
+        """ Shrink or grow the batches by whether any request was throttled. """
+        for limit in (self._batch_limit, self._pipeline_limit):
+            if limit is None:
+                continue
+            elif outcome['throttled']:
+                limit.throttled()
+            else:
+                limit.succeeded()
+        if outcome['throttled']:
+            logger.debug("Throttled; batches are now %d requests.",
+                    self._batch_limit.value)
+
+    async def __sent(self, batch):
+        """ Wait for the async batches being sent. """
+        while len(batch['sending']) > 0:
+            sending, batch['sending'] = batch['sending'], []
+            await asyncio.gather(*sending)
+
+    def __wait(self, batch):
+        for flushing in batch.get('flushing', []):
+            # Surface any error raised while sending in the background.
+            flushing.result()
+
+    def __retry(self, batch):
+        """ Send the requests queued for retry, once their wait is over. """
+        while len(batch.get('retries', [])) > 0:
+            retries = sorted(batch.pop('retries'), key=lambda r: r[0])
+            self._sleep(max(0, retries[0][0] - self._clock()))
+            now = self._clock()
+            logger.debug("Retrying %d requests.", len(retries))
+            for retry in retries:
+                if retry[0] > now:
+                    batch.setdefault('retries', []).append(retry)
+                else:
+                    self.__add(batch, retry[1], retry[2], attempt=retry[3])
+            self.__flush(batch)
+            self.__wait(batch)
+
+    def __list_all(self, **kwargs):
+        """ Lazily load the tasks in every list. """
+        task_lists = list(self._task_lists.keys())
+        if self._concurrency <= 1 or len(task_lists) < 2:
+            for task_list in task_lists:
+                for page in self.__list_pages(task_list, **kwargs):
+                    for task in page:
+                        yield task
+            return
+
+        # Workers hand over whole pages. The queue is bounded so that memory
+        # stays bounded when the consumer is slower than the network.
+        pages = queue.Queue(maxsize=self._concurrency * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def fetch(task_list):
+            try:
+                for page in self.__list_pages(task_list, **kwargs):
+                    while not stopped.is_set():
+                        try:
+                            pages.put(page, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+            finally:
+                pages.put(done)
+
+        pool = ThreadPoolExecutor(max_workers=self._concurrency)
+        futures = []
+        try:
+            futures += [pool.submit(fetch, t) for t in task_lists]
+            remaining = len(futures)
+            while remaining > 0:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                    continue
+                for task in page:
+                    yield task
+            for future in futures:
+                # Surface any error raised while fetching.
+                future.result()
+        finally:
+            stopped.set()
+            while any(not f.done() for f in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            pool.shutdown()
+
+    def __list_pages(self, task_list, **kwargs):
+        """ Lazily load the tasks in a list, a page at a time. """
+        logger.debug("Retrieving tasks for %s.", task_list)
+        page_token = None
+        while True:
+            method = lambda s: s.list(tasklist=self._task_lists[task_list],
+                    maxResults=self.__PAGE_SIZE, pageToken=page_token,
+                    fields=self.__PAGE_FIELDS, **kwargs)
+            try:
+                page = self._client.execute(self._client.tasks(method))
+            except HttpError as e:
+                if not page_token is None or not self.__stale(e):
+                    raise
+                elif not task_list in self._task_lists:
+                    logger.info("Task list %s no longer exists.", task_list)
+                    return
+                continue
+            yield [self._factory.create_from(task_list, map=t, copy=False)
+                    for t in page.get('items', [])
+                    if t.get('title', '') != '']
+
+            page_token = page.get('nextPageToken', None)
+            if page_token is None:
+                return
+
+    async def __list_pages_async(self, task_list, **kwargs):
+        """ Load the tasks in a list, a page after another. """
+        logger.debug("Retrieving tasks for %s.", task_list)
+        tasks = []
+        page_token = None
+        while True:
+            method = lambda s: s.list(tasklist=self._task_lists[task_list],
+                    maxResults=self.__PAGE_SIZE, pageToken=page_token,
+                    fields=self.__PAGE_FIELDS, **kwargs)
+            try:
+                page = await self._async_client.execute(
+                        self._client.tasks(method))
+            except HttpError as e:
+                loop = asyncio.get_running_loop()
+                if not page_token is None\
+                        or not await loop.run_in_executor(None, self.__stale, e):
+                    raise
+                elif not task_list in self._task_lists:
+                    logger.info("Task list %s no longer exists.", task_list)
+                    return tasks
+                continue
+            tasks += [self._factory.create_from(task_list, map=t, copy=False)
+                    for t in page.get('items', [])
+                    if t.get('title', '') != '']
+
+            page_token = page.get('nextPageToken', None)
+            if page_token is None:
+                return tasks
+
+    def __task_list_id(self, title, default=None):
+        """ The id of the titled list, listing them again if it's unknown. """
+        if not title in self._task_lists and not self.__task_lists_fetched:
+            logger.debug("Task list %s is unknown; listing them again.", title)
+            self.__reload_task_lists()
+        if default is None:
+            return self._task_lists[title]
+        return self._task_lists.get(title, default)
+
+    def __stale(self, exception):
+        """
+        Identifies if a request failed because a list was removed since the
+        lists were last listed, in which case they're listed again.
+        """
+        if not isinstance(exception, HttpError) or exception.resp.status != 404\
+                or self.__task_lists_fetched:
+            return False
+        logger.debug("A task list wasn't found; listing them again.")
+        self.__reload_task_lists()
+        return True
+
+    def __reload_task_lists(self):
+        with self.__task_lists_lock:
+            self.__task_lists = self.__load_task_lists(
+                    self.__task_list_filter, refresh=True)
+
+    def __load_task_lists(self, task_list_filter, refresh=False):
+        """
+        The ids of the lists by title: those cached, while they're fresh, or
+        those listed now. With 'refresh', the lists are always listed.
+        """
+        directory = self.__directory
+        if directory is None and not self._task_list_cache is None:
+            directory = self._task_list_cache.load()
+
+        now = self._clock()
+        if refresh or directory is None\
+                or now - directory['fetched'] >= self._task_list_ttl:
+            directory = self.__fetch_task_lists(
+                    None if refresh else directory, now)
+            self.__task_lists_fetched = True
+            if not self._task_list_cache is None:
+                self._task_list_cache.store(directory)
+        else:
+            logger.debug("Using the task lists listed at %s.",
+                    directory['fetched'])
 
-    def __load_task_lists(self, task_list_filter):
-        lists = self._client.tasklists(lambda s: s.list())
-        lists = self._client.execute(lists)
-        return {p['title']:p['id']
-                for p in lists['items']
-                if task_list_filter(p['title'])}
+        self.__directory = directory
+        self.__task_lists_expiry = directory['fetched'] + self._task_list_ttl
+        return {title:list_id
+                for title, list_id in directory['lists'].items()
+                if task_list_filter(title)}
+
+    def __fetch_task_lists(self, directory, now):
+        """
+        List every task list, a page at a time, unless the directory is
+        still current by its etag. Only a directory of one page has an
+        etag, as the etag of its first page says nothing of the others.
+        """
+        etag = None if directory is None else directory['etag']
+        lists = {}
+        pages = 0
+        page_token = None
+        while True:
+            method = lambda s: s.list(maxResults=self.__PAGE_SIZE,
+                    pageToken=page_token, fields=self.__LIST_PAGE_FIELDS)
+            request = self._client.tasklists(method)
+            if not etag is None:
+                request.headers['If-None-Match'] = etag
+            try:
+                page = self._client.execute(request)
+            except HttpError as e:
+                if e.resp.status != 304:
+                    raise
+                logger.debug("Task lists are unchanged.")
+                return dict(directory, fetched=now)
+            pages += 1
+            lists.update({p['title']:p['id'] for p in page.get('items', [])})
+            page_token = page.get('nextPageToken', None)
+            if page_token is None:
+                break
+            etag = None
+        return {'lists':lists, 'fetched':now,
+                'etag':page.get('etag', None) if pages == 1 else None}
 
     def __batch_cb(self, gtask, userdata, cb):
         def impl(request_id, response, exception):
@@ -212,14 +740,52 @@ class GoogleTaskRepository(TaskRepository):
         return impl
 
 class ApiClient(object):
-    """ Wrapper around Google Task API. """
-    def __init__(self, flags, **kwargs):
-        self._http = self._authenticate(flags, **kwargs).authorize(httplib2.Http())
-        self._service = discovery.build(
-            serviceName='tasks',
-            version='v1',
-            http=self._http
-        )
+    """
+    Wrapper around Google Task API. httplib2 isn't thread-safe, so each
+    thread executes requests through its own authorized Http.
+
+    The service is built from the discovery document shipped in
+    tasksync/discovery rather than one fetched from Google, and not until
+    the first request.
+
+    When an api_root is given, requests go, unauthenticated, to a stand-in
+    server at that URL instead of Google (see tests/google_tasks_server.py).
+
+    Responses are gzipped, and 'transfer' counts the bytes sent and
+    received.
+    """
+    def __init__(self, flags, api_root=None, max_retries=5, quota=None,
+            **kwargs):
+        self._local = threading.local()
+        self._max_retries = max_retries
+        self._quota = quota
+        self._sleep = time.sleep
+        self._lock = threading.Lock()
+        self._api_root = api_root
+        self.transfer = Transfer()
+        self._credentials = None
+        if api_root is None:
+            self._credentials = self._authenticate(flags, **kwargs)
+        self.__service = None
+
+    @property
+    def _service(self):
+        with self._lock:
+            if self.__service is None:
+                document = discovery_document()
+                document['rootUrl'] = self.root_url
+                self.__service = discovery.build_from_document(document,
+                        http=self._http)
+            return self.__service
+
+    @property
+    def _http(self):
+        if not hasattr(self._local, 'http'):
+            http = set_user_agent(CountingHttp(self.transfer), USER_AGENT)
+            if not self._credentials is None:
+                http = self._credentials.authorize(http)
+            self._local.http = http
+        return self._local.http
 
     def _authenticate(self, flags, **kwargs):
         """ Get the auth token. """
@@ -230,7 +796,7 @@ class ApiClient(object):
                     'https://www.googleapis.com/auth/tasks',
                     'https://www.googleapis.com/auth/tasks.readonly'
                 ],
-                user_agent='tasksync/1.0')
+                user_agent=USER_AGENT)
 
         storage = Storage(kwargs['credential_storage'])
         credentials = storage.get()
@@ -240,13 +806,202 @@ class ApiClient(object):
 
         return credentials
 
+    @property
+    def root_url(self):
+        """ The URL requests are sent under, ending in a slash. """
+        if self._api_root is None:
+            return discovery_document()['rootUrl']
+        return self._api_root.rstrip('/') + '/'
+
+    @property
+    def credentials(self):
+        """ The OAuth credentials, or None for a stand-in server. """
+        return self._credentials
+
+    def acquire(self, calls):
+        """ Wait for the quota to allow the calls of a batch. """
+        if not self._quota is None:
+            self._quota.acquire(calls)
+
     def tasklists(self, method):
         return method(self._service.tasklists())
 
     def tasks(self, method):
         return method(self._service.tasks())
 
+    def new_batch(self):
+        return self._service.new_batch_http_request()
+
     def execute(self, executable):
+        """
+        Execute a request, or a whole batch, retrying it when throttled or
+        when the server fails.
+        """
         if executable is None:
             return None
-        return executable.execute(http=self._http)
+        attempt = 0
+        while True:
+            if not isinstance(executable, BatchHttpRequest):
+                # Batches are counted by their requests; see acquire.
+                self.acquire(1)
+            try:
+                return executable.execute(http=self._http)
+            except HttpError as e:
+                if attempt >= self._max_retries or not is_retriable(e):
+                    raise
+                delay = backoff(attempt, retry_after(e))
+                logger.debug("Retrying in %.1fs: %s", delay, e)
+                self._sleep(delay)
+                attempt += 1
+
+class AsyncBatch(object):
+    """ Requests to be sent together by an AsyncApiClient. """
+    def __init__(self):
+        self.requests = []
+
+    def add(self, request, callback=None):
+        self.requests.append((request, callback))
+
+class AsyncApiClient(object):
+    """
+    Sends the requests built by an ApiClient over asyncio, through a
+    tasksync.async_http.AsyncHttp, with at most 'max_connections' in flight.
+    Requests are retried, and count against the quota, as with ApiClient,
+    and are counted by 'transfer', if given.
+    """
+    def __init__(self, root_url, credentials=None, max_connections=4,
+            max_retries=5, quota=None, transfer=None):
+        self._root_url = root_url
+        self._credentials = credentials
+        self._http = AsyncHttp(max_connections=max_connections,
+                transfer=transfer)
+        self._max_retries = max_retries
+        self._quota = quota
+        self._sleep = asyncio.sleep
+
+    @property
+    def stats(self):
+        return self._http.stats
+
+    async def acquire(self, calls):
+        """ Wait, off the event loop, for the quota to allow the calls. """
+        if not self._quota is None:
+            await asyncio.get_running_loop().run_in_executor(None,
+                    self._quota.acquire, calls)
+
+    async def execute(self, request):
+        """ Send a request, returning its parsed response. """
+        status, headers, content = await self.__send(request.method,
+                request.uri, request.headers, request.body, calls=1)
+        return _parse_content(content)
+
+    async def execute_batch(self, batch):
+        """
+        Send the requests of a batch in one request, reporting each to its
+        callback as a BatchHttpRequest does. Batches are counted by their
+        requests; see acquire.
+        """
+        if len(batch.requests) == 0:
+            return
+        boundary = uuid.uuid4().hex
+        parts = []
+        for i, (request, _) in enumerate(batch.requests):
+            parts.append('--%s\r\nContent-Type: application/http\r\n'
+                    'Content-Transfer-Encoding: binary\r\n'
+                    'Content-ID: <%d>\r\n\r\n' % (boundary, i + 1))
+            parts.append(_serialize_request(request))
+        parts.append('--%s--' % boundary)
+        headers = {'Content-Type':'multipart/mixed; boundary="%s"' % boundary}
+        status, headers, content = await self.__send('POST',
+                self._root_url + 'batch', headers, ''.join(parts), calls=0)
+
+        content_type = headers.get('content-type', '').encode('utf-8')
+        message = BytesParser().parsebytes(
+                b'Content-Type: ' + content_type + b'\r\n\r\n' + content)
+        responses = {}
+        for part in message.get_payload():
+            content_id = part['Content-ID'].strip('<>').split('-')[-1]
+            responses[content_id] = part.get_payload()
+
+        for i, (request, callback) in enumerate(batch.requests):
+            request_id = str(i + 1)
+            status, headers, content = _deserialize_response(
+                    responses[request_id])
+            if callback is None:
+                continue
+            if status >= 300:
+                callback(request_id, None,
+                        _http_error(status, headers, content, request.uri))
+            else:
+                callback(request_id, _parse_content(content), None)
+
+    async def close(self):
+        await self._http.close()
+
+    async def __send(self, method, uri, headers, body, calls):
+        """ Send a request, retrying it when throttled or the server fails. """
+        attempt = 0
+        refreshed = False
+        while True:
+            if calls > 0:
+                await self.acquire(calls)
+            headers = dict(headers)
+            headers['user-agent'] = USER_AGENT
+            await self.__authorize(headers, refresh=False)
+            status, response_headers, content = await self._http.request(
+                    method, uri, headers=headers, body=body)
+            if status < 300:
+                return status, response_headers, content
+            if status == 401 and not refreshed and not self._credentials is None:
+                # The token expired since it was checked.
+                await self.__authorize(headers, refresh=True)
+                refreshed = True
+                continue
+            error = _http_error(status, response_headers, content, uri)
+            if attempt >= self._max_retries or not is_retriable(error):
+                raise error
+            delay = backoff(attempt, retry_after(error))
+            logger.debug("Retrying in %.1fs: %s", delay, error)
+            await self._sleep(delay)
+            attempt += 1
+
+    async def __authorize(self, headers, refresh):
+        credentials = self._credentials
+        if credentials is None:
+            return
+        if refresh or credentials.access_token is None\
+                or credentials.access_token_expired:
+            # oauth2client only refreshes over a blocking httplib2.Http.
+            await asyncio.get_running_loop().run_in_executor(None,
+                    credentials.refresh, httplib2.Http())
+        credentials.apply(headers)
+
+def _serialize_request(request):
+    """ A request in the application/http form of a batch part. """
+    parts = urlsplit(request.uri)
+    target = parts.path + ('?' + parts.query if parts.query else '')
+    lines = ['%s %s HTTP/1.1' % (request.method, target)]
+    lines += ['%s: %s' % (k, v) for k, v in request.headers.items()
+            if k.lower() != 'content-length']
+    body = request.body or ''
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    if len(body) > 0:
+        lines.append('Content-Length: %d' % len(body.encode('utf-8')))
+    return '\r\n'.join(lines) + '\r\n\r\n' + body + '\r\n'
+
+def _deserialize_response(payload):
+    """ The status, headers and content of a batch part. """
+    status_line, payload = payload.split('\n', 1)
+    head, content = (payload.split('\r\n\r\n', 1) + [''])[:2]
+    headers = {k.lower():v for k, v in Parser().parsestr(head).items()}
+    return int(status_line.split(' ')[1]), headers, content.encode('utf-8')
+
+def _parse_content(content):
+    if len(content) == 0:
+        return {}
+    return json.loads(content.decode('utf-8'))
+
+def _http_error(status, headers, content, uri):
+    return HttpError(httplib2.Response(dict(headers, status=status)),
+            content, uri=uri)
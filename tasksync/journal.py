@@ -0,0 +1,110 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+An append-only journal of the tasks TaskWarrior adds and modifies, written
+by the hooks in tasksync/hooks, so a sync can read just those tasks.
+"""
+import fcntl
+import json
+import os
+import sys
+
+JOURNAL_NAME = 'tasksync.journal'
+
+class Journal(object):
+    """
+    One JSON task per line. Writers and compaction hold an exclusive lock
+    on the file; readers only read up to the last complete line.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.expanduser(path)
+
+    @property
+    def path(self):
+        return self._path
+
+    def exists(self):
+        return os.path.exists(self._path)
+
+    def append(self, task):
+        line = (json.dumps(task, sort_keys=True) + '\n').encode('utf-8')
+        with open(self._path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self):
+        """
+        Read the latest journaled version of each task. Returns the tasks,
+        by uuid, and the offset up to which they were read.
+        """
+        try:
+            with open(self._path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return {}, 0
+
+        # A line still being written is read next time.
+        offset = data.rfind(b'\n') + 1
+        tasks = {}
+        for line in data[:offset].splitlines():
+            if len(line.strip()) == 0:
+                continue
+            task = json.loads(line.decode('utf-8'))
+            tasks[task['uuid']] = task
+        return tasks, offset
+
+    def compact(self, offset):
+        """ Drop the entries before an offset returned by read. """
+        if offset <= 0 or not self.exists():
+            return
+        with open(self._path, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(offset)
+                rest = f.read()
+                f.seek(0)
+                f.write(rest)
+                f.truncate()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def hook(event, argv=None, stdin=None, stdout=None):
+    """
+    Run as a TaskWarrior on-add or on-modify hook: journal the added or
+    modified task and hand it back to TaskWarrior unchanged. A failure to
+    journal is reported, but never stops the change.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    lines = stdin.read().splitlines()
+    task = lines[-1] if event == 'on-modify' else lines[0]
+    stdout.write(task + '\n')
+
+    args = dict(a.split(':', 1) for a in argv if ':' in a)
+    location = args.get('data', os.path.join('~', '.task'))
+    try:
+        Journal(os.path.join(location, JOURNAL_NAME)).append(json.loads(task))
+    except (IOError, OSError, ValueError) as e:
+        stdout.write("tasksync couldn't journal the change: %s\n" % e)
+    return 0
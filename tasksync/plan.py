@@ -0,0 +1,163 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Sync plans: what a sync would write, what that would cost, and a JSON form
+from which a later run can make exactly those writes.
+"""
+from tasksync.task import DownstreamTask
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+ACTIONS = ('create', 'update', 'unchanged', 'delete', 'orphan')
+
+def describe(execution, upstream_q, downstream_q):
+    """
+    Describe the queues returned by plan_sync. Filters and callbacks only
+    run when a sync is applied, so the counts are upper bounds. When a
+    repository has an API quota, the report's 'quota' compares the calls
+    the writes would make with what is left of it today.
+    """
+    report = {
+        'downstream':_describe(execution['upstream'], execution['downstream'],
+            downstream_q, True),
+        'upstream':_describe(execution['downstream'], execution['upstream'],
+            upstream_q, False),
+    }
+    report['quota'] = _quota(execution, report)
+    return report
+
+def restore(execution, report):
+    """
+    Rebuild the (upstream_q, downstream_q) queues of a described plan,
+    loading only the tasks it names. Actions on tasks that no longer
+    exist are skipped.
+    """
+    return (
+        _restore(execution['downstream'], execution['upstream'],
+            report['upstream']['actions']),
+        _restore(execution['upstream'], execution['downstream'],
+            report['downstream']['actions']),
+    )
+
+def dump(reports, f):
+    """ Write the reports of several executions, by name, as JSON. """
+    json.dump({'version':PLAN_VERSION, 'executions':reports}, f,
+            indent=2, sort_keys=True)
+
+def load(f):
+    """ Read the reports written by dump. """
+    plan = json.load(f)
+    if plan.get('version', None) != PLAN_VERSION:
+        raise ValueError("Unsupported plan version, %s." % plan.get('version'))
+    return plan['executions']
+
+def format_report(name, report):
+    """ Format a report for people. """
+    lines = ["%s:" % name]
+    for direction in ('downstream', 'upstream'):
+        counts = report[direction]['counts']
+        cost = report[direction]['cost']
+        lines.append("  %s: %s" % (direction,
+            ", ".join("%d %s" % (counts[a], a) for a in ACTIONS)))
+        lines.append("    %d API calls, %d task subprocesses, %d batches" % (
+            cost['api_calls'], cost['subprocesses'], cost['batches']))
+
+    quota = report.get('quota', None)
+    if not quota is None:
+        lines.append("  quota: %d API calls, %d used today, %s remaining" % (
+            quota['api_calls'], quota['used'],
+            'unlimited' if quota['remaining'] is None else quota['remaining']))
+        if not quota['remaining'] is None and quota['api_calls'] > quota['remaining']:
+            lines.append("    Today's quota can't cover this sync.")
+    return "\n".join(lines)
+
+def _describe(source, dest, queue, downstream):
+    counts = {a:0 for a in ACTIONS}
+    actions = []
+    writebacks = 0
+    for (source_task, dest_task) in queue:
+        action = _action(dest, source_task, dest_task)
+        counts[action] += 1
+        actions.append({
+            'action':action,
+            'source':None if source_task is None else source_task.uid,
+            'dest':None if dest_task is None else dest_task.uid,
+        })
+        if (action == 'create' and isinstance(source_task, DownstreamTask)
+                and source_task.association is None):
+            # The new association is written back to the source.
+            writebacks += 1
+
+    saves = counts['create'] + counts['update']
+    if downstream:
+        # Unchanged downstream tasks still have their etag updated.
+        saves += counts['unchanged']
+    cost = dest['repository'].estimate(saves, counts['delete'])
+    source_cost = source['repository'].estimate(writebacks, 0)
+    return {
+        'counts':counts,
+        'cost':{k:cost[k] + source_cost[k] for k in cost},
+        'actions':actions,
+    }
+
+def _quota(execution, report):
+    for side in ('upstream', 'downstream'):
+        quota = execution[side]['repository'].quota
+        if quota is None:
+            continue
+        calls = sum(report[d]['cost']['api_calls']
+                for d in ('downstream', 'upstream'))
+        return {'api_calls':calls, 'used':quota.used(),
+                'remaining':quota.remaining()}
+    return None
+
+def _action(dest, source_task, dest_task):
+    if source_task is None or source_task.is_deleted:
+        return 'delete' if dest['delete_orphans'] else 'orphan'
+    elif dest_task is None:
+        return 'create'
+    elif dest_task.fingerprint == source_task.fingerprint:
+        return 'unchanged'
+    else:
+        return 'update'
+
+def _restore(source, dest, actions):
+    sources = _get(source['repository'], [a['source'] for a in actions])
+    dests = _get(dest['repository'], [a['dest'] for a in actions])
+
+    queue = []
+    for action in actions:
+        source_task = sources.get(action['source'], None)
+        dest_task = dests.get(action['dest'], None)
+        if ((not action['source'] is None and source_task is None)
+                or (not action['dest'] is None and dest_task is None)):
+            logger.warning("Skipping %s of %s->%s, which no longer exists.",
+                    action['action'], action['source'], action['dest'])
+            continue
+        queue.append((source_task, dest_task))
+    return queue
+
+def _get(repository, uids):
+    uids = set(u for u in uids if not u is None)
+    if len(uids) == 0:
+        return {}
+    return {t.uid:t for t in repository.get(uids)}
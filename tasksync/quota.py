@@ -0,0 +1,124 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+""" API quota shared by every client of one Google project. """
+from datetime import datetime
+
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT PRIMARY KEY,
+    used INTEGER NOT NULL
+);
+"""
+
+class QuotaExceeded(Exception):
+    """ Raised instead of making calls the daily quota can't cover. """
+    pass
+
+class Quota(object):
+    """
+    Spaces calls out to at most 'per_second' on average, allowing bursts of
+    as many, and refuses calls beyond 'per_day'. Either may be None for no
+    limit. The calls made each (UTC) day are counted in the database at
+    'path', so that every process using the same project can share it.
+    """
+
+    def __init__(self, per_second=None, per_day=None, path=':memory:',
+            clock=time.time, sleep=time.sleep):
+        self._per_second = per_second
+        self._per_day = per_day
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = per_second
+        self._filled = clock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                isolation_level=None)
+        self._db.executescript(_SCHEMA)
+
+    @property
+    def per_day(self):
+        return self._per_day
+
+    def used(self):
+        """ The calls counted today. """
+        with self._lock:
+            row = self._db.execute("SELECT used FROM usage WHERE day = ?",
+                    (self.__today(),)).fetchone()
+        return 0 if row is None else row[0]
+
+    def remaining(self):
+        """ The calls left today, or None without a daily limit. """
+        if self._per_day is None:
+            return None
+        return max(0, self._per_day - self.used())
+
+    def acquire(self, calls=1):
+        """
+        Wait until 'calls' calls may be made, and count them. Raises
+        QuotaExceeded, without counting them, if today's quota can't cover
+        them.
+        """
+        if calls < 1:
+            return
+        with self._lock:
+            self.__count(calls)
+            wait = self.__take(calls)
+        if wait > 0:
+            logger.debug("Waiting %.2fs for quota.", wait)
+            self._sleep(wait)
+
+    def __count(self, calls):
+        day = self.__today()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT used FROM usage WHERE day = ?",
+                    (day,)).fetchone()
+            used = 0 if row is None else row[0]
+            if not self._per_day is None and used + calls > self._per_day:
+                raise QuotaExceeded("%d of %d calls are used today; %d more "
+                        "can't be made." % (used, self._per_day, calls))
+            self._db.execute("INSERT OR REPLACE INTO usage (day, used) "
+                    "VALUES (?, ?)", (day, used + calls))
+            self._db.execute("COMMIT")
+        except:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def __take(self, calls):
+        """ Take tokens, returning how long to wait for them to be earned. """
+        if self._per_second is None:
+            return 0
+        now = self._clock()
+        self._tokens = min(self._per_second,
+                self._tokens + (now - self._filled) * self._per_second)
+        self._filled = now
+        # A batch may cost more than a whole burst; the debt is paid by
+        # waiting, both here and by the calls that follow.
+        self._tokens -= calls
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / float(self._per_second)
+
+    def __today(self):
+        return datetime.utcfromtimestamp(self._clock()).strftime('%Y-%m-%d')
@@ -0,0 +1,95 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+When and how long to wait before retrying a failed Google API request, and
+a limit that adapts to throttling.
+"""
+from googleapiclient.errors import HttpError
+
+import json
+import random
+import threading
+
+# Statuses worth retrying: throttling and transient server errors.
+RETRIABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Google reports some throttling as a 403 with one of these reasons.
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+def is_throttled(exception):
+    """ Identifies if a request failed because it was rate limited. """
+    if not isinstance(exception, HttpError):
+        return False
+    status = exception.resp.status
+    return status == 429 or (status == 403 and __reason(exception) in RATE_LIMIT_REASONS)
+
+def is_retriable(exception):
+    """ Identifies if a failed request may succeed when retried. """
+    if not isinstance(exception, HttpError):
+        return False
+    return exception.resp.status in RETRIABLE_STATUSES or is_throttled(exception)
+
+def retry_after(exception):
+    """ The seconds the server asked to wait, if it asked. """
+    try:
+        return float(exception.resp.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def backoff(attempt, wait=None, base=1.0, cap=64.0):
+    """
+    The seconds to wait before retry 'attempt' (from zero): a random time
+    up to 'base' doubled each attempt, capped, but never shorter than the
+    'wait' asked for by the server.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if not wait is None:
+        delay = max(delay, wait)
+    return delay
+
+class AdaptiveLimit(object):
+    """
+    A limit that halves, down to 'minimum', when throttled and grows by one,
+    up to 'maximum', after each success.
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self._minimum = minimum
+        self._maximum = maximum
+        self._value = maximum
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def throttled(self):
+        with self._lock:
+            self._value = max(self._minimum, self._value // 2)
+
+    def succeeded(self):
+        with self._lock:
+            self._value = min(self._maximum, self._value + 1)
+
+def __reason(exception):
+    try:
+        content = exception.content
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        return json.loads(content)['error']['errors'][0]['reason']
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
@@ -0,0 +1,98 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Runs the executions of a runbook concurrently, keeping executions that
+share a store (see TaskRepository.resource) one after another.
+"""
+from tasksync.sync import sync_all
+
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def run_all(runbook, jobs=1, run=sync_all):
+    """
+    Run every execution of the runbook with up to 'jobs' at the same time.
+    A failed execution doesn't stop the others. Returns, by name, a dict of
+    the 'status' ('ok' or 'failed'), the 'summary' returned by 'run', the
+    'error' raised, if any, and the 'seconds' taken.
+    """
+    results = {}
+    groups = group(runbook)
+
+    def run_group(names):
+        for name in names:
+            results[name] = _run(name, runbook[name], run)
+
+    if jobs <= 1 or len(groups) < 2:
+        for names in groups:
+            run_group(names)
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for future in [pool.submit(run_group, g) for g in groups]:
+                future.result()
+    return results
+
+def group(runbook):
+    """
+    Split the runbook's execution names into groups that share no store.
+    Names keep their runbook order within a group.
+    """
+    owners = {}
+    groups = {}
+    for name in runbook:
+        merged = set([name])
+        for resource in _resources(runbook[name]):
+            owner = owners.get(resource, None)
+            if not owner is None and owner in groups:
+                merged.update(groups.pop(owner))
+        for member in merged:
+            for resource in _resources(runbook[member]):
+                owners[resource] = name
+        groups[name] = merged
+    return [[n for n in runbook if n in g] for g in groups.values()]
+
+def format_results(results):
+    """ Format the results of run_all for people. """
+    lines = []
+    for name in sorted(results):
+        result = results[name]
+        if result['status'] == 'ok':
+            lines.append("%s: ok in %.1fs" % (name, result['seconds']))
+        else:
+            lines.append("%s: failed in %.1fs: %s" % (name, result['seconds'],
+                result['error']))
+    return "\n".join(lines)
+
+def _run(name, execution, run):
+    logger.info("Running - %s.", name)
+    started = time.time()
+    try:
+        summary = run(execution)
+        return {'status':'ok', 'summary':summary, 'error':None,
+                'seconds':time.time() - started}
+    except Exception as e:
+        logger.exception("Couldn't run %s.", name)
+        return {'status':'failed', 'summary':None, 'error':e,
+                'seconds':time.time() - started}
+
+def _resources(execution):
+    return [execution[side]['repository'].resource
+            for side in ('upstream', 'downstream')]
@@ -0,0 +1,153 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+""" Persistent sync state, used to drive incremental syncs. """
+from tasksync.task import DownstreamTask
+
+from datetime import datetime, timedelta
+
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Changes are requested from a little before the last sync started so that
+# clock skew between this host and the upstream provider can't hide an edit.
+SKEW = timedelta(minutes=5)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS association (
+    provider TEXT NOT NULL,
+    upstream_uid TEXT NOT NULL,
+    downstream_uid TEXT NOT NULL,
+    etag TEXT,
+    fingerprint TEXT,
+    PRIMARY KEY (provider, upstream_uid)
+);
+CREATE INDEX IF NOT EXISTS association_downstream
+    ON association (downstream_uid);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class SyncState(object):
+    """
+    Records, for each association, the last-synced upstream etag and the
+    field fingerprint of the pair, along with when the last successful sync
+    started. Changes are buffered until commit() so a failed sync leaves the
+    previous state untouched.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._records = {}
+        self._forgotten = set()
+
+    def last_synced(self):
+        """
+        Get the UTC time from which changes must be requested, or None if
+        no sync has completed.
+        """
+        with self._lock:
+            row = self._db.execute(
+                    "SELECT value FROM meta WHERE key = 'last_synced'").fetchone()
+        if row is None:
+            return None
+        return datetime.strptime(row[0], _DATE_FORMAT) - SKEW
+
+    def downstream_uid(self, provider, upstream_uid):
+        """ Get the downstream uid associated with the upstream task. """
+        with self._lock:
+            row = self._db.execute(
+                    "SELECT downstream_uid FROM association"
+                    " WHERE provider = ? AND upstream_uid = ?",
+                    (provider, upstream_uid)).fetchone()
+        return None if row is None else row[0]
+
+    def is_echo(self, dtask):
+        """
+        Identifies if a changed downstream task is only the result of the
+        last sync writing to it: its etag and fingerprint are unchanged.
+        """
+        for provider, upstream_uid in dtask.associations.items():
+            with self._lock:
+                row = self._db.execute(
+                        "SELECT downstream_uid, etag, fingerprint FROM association"
+                        " WHERE provider = ? AND upstream_uid = ?",
+                        (provider, upstream_uid)).fetchone()
+            if row is None or row != (dtask.uid, dtask.etag, dtask.fingerprint):
+                return False
+        return len(dtask.associations) > 0
+
+    def begin(self):
+        """ Discard anything recorded but not committed. """
+        with self._lock:
+            self._records = {}
+            self._forgotten = set()
+
+    def record(self, dtask, utask):
+        """ Record that the specified tasks are now in sync. """
+        if dtask.uid is None or utask.uid is None:
+            return
+        key = (utask.provider, utask.uid)
+        with self._lock:
+            self._forgotten.discard(key)
+            self._records[key] = (dtask.uid, utask.etag, dtask.fingerprint)
+
+    def forget(self, task):
+        """ Forget any association held by the specified (deleted) task. """
+        with self._lock:
+            if isinstance(task, DownstreamTask):
+                keys = task.associations.items()
+            else:
+                keys = [(task.provider, task.uid)]
+            for key in keys:
+                self._records.pop(key, None)
+                self._forgotten.add(key)
+
+    def commit(self, started=None):
+        """
+        Persist everything recorded. When a UTC start time is given, the
+        sync that began then is marked as complete.
+        """
+        with self._lock:
+            self._db.executemany(
+                    "DELETE FROM association"
+                    " WHERE provider = ? AND upstream_uid = ?",
+                    list(self._forgotten))
+            self._db.executemany(
+                    "INSERT OR REPLACE INTO association"
+                    " (provider, upstream_uid, downstream_uid, etag, fingerprint)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [k + v for k, v in self._records.items()])
+            if not started is None:
+                self._db.execute(
+                        "INSERT OR REPLACE INTO meta (key, value)"
+                        " VALUES ('last_synced', ?)",
+                        (started.strftime(_DATE_FORMAT),))
+            self._db.commit()
+            logger.debug("Committed %d associations.", len(self._records))
+            self._records = {}
+            self._forgotten = set()
+
@@ -16,25 +16,64 @@
 # along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
 
 #pylint: disable=C0111
+from tasksync.plan import describe, restore
 from tasksync.task import DownstreamTask
 
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 import sys
 import logging
+import queue
+import threading
 logger = logging.getLogger(__name__)
 
+# Upstream tasks are streamed in chunks of this many, with this many chunks
+# loaded ahead of the matching.
+_STREAM_CHUNK_SIZE = 100
+_STREAM_CHUNKS = 100
+
 def sync_all(execution):
-    """ Pulls down the task list. """
-    dtasks = set(execution['downstream']['repository'].all())
-    utasks = set(execution['upstream']['repository'].all())
+    """
+    Pulls down the task list. Returns, for each direction, the number of
+    tasks saved, deleted and skipped. When the execution's checkpoint shows
+    an unfinished sync, that sync is finished instead.
+    """
+    checkpoint = execution.get('checkpoint', None)
+    if not checkpoint is None:
+        pending = checkpoint.pending()
+        if not pending is None:
+            return resume_sync(execution, *pending)
+
+    started = datetime.utcnow()
+    upstream_q, downstream_q = plan_sync(execution)
+    return apply_sync(execution, upstream_q, downstream_q, started)
+
+def plan_sync(execution):
+    """
+    Load and match the tasks of an execution without writing anything.
+    Returns the queues of (source, dest) pairs to sync upstream and
+    downstream. A missing source is an orphan; a missing dest is new.
+    """
+    state = execution.get('state', None)
+    if not state is None:
+        state.begin()
+
+    dtasks, associations, utasks = __load_tasks(execution, state)
 
     upstream_q = []
     downstream_q = []
 
+    # Upstream tasks may be streamed in, so matching begins with the first.
+    seen = set()
     for utask in utasks:
-        if not utask.should_sync():
+        if utask in seen or not utask.should_sync():
             continue
+        seen.add(utask)
 
-        known_tasks = [t for t in dtasks if t.is_associated_with(utask)]
+        candidates = associations.get((utask.provider, utask.uid), ())
+        known_tasks = [t for t in candidates
+                if t in dtasks and t.is_associated_with(utask)]
         if len(known_tasks) == 0:
             logger.debug("Upstream %s isn't known downstream.", utask)
             downstream_q.append((utask, None))
@@ -43,6 +82,8 @@ def sync_all(execution):
                 dtasks.discard(dtask)
                 if dtask == utask:
                     logger.debug("Tasks %s and %s are up-to-date.", utask, dtask)
+                    if not state is None:
+                        state.record(dtask, utask)
                 elif dtask.stale(utask):
                     logger.info("Sync required %s->%s.", utask, dtask)
                     downstream_q.append((utask, dtask))
@@ -63,19 +104,223 @@ def sync_all(execution):
         else:
             downstream_q.append((None, dtask))
 
-    __sync_tasks(execution['upstream'], execution['downstream'], downstream_q)
-    __sync_tasks(execution['downstream'], execution['upstream'], upstream_q)
+    return upstream_q, downstream_q
+
+def apply_sync(execution, upstream_q, downstream_q, started=None):
+    """
+    Write the planned changes. When 'started' is given, the state records
+    the sync that began then as complete. With a 'checkpoint' in the
+    execution, the plan and each write are recorded as they land.
+    """
+    state = execution.get('state', None)
+    checkpoint = execution.get('checkpoint', None)
+    if not checkpoint is None:
+        checkpoint.begin(describe(execution, upstream_q, downstream_q), started)
+
+    summary = {
+        'downstream':__sync_tasks(execution['upstream'], execution['downstream'],
+            downstream_q, state, __progress(checkpoint, 'downstream')),
+        'upstream':__sync_tasks(execution['downstream'], execution['upstream'],
+            upstream_q, state, __progress(checkpoint, 'upstream')),
+    }
+    logger.info("Skipped %d writes with no visible change.",
+            summary['downstream']['skipped'] + summary['upstream']['skipped'])
+
+    if not state is None:
+        state.commit(started)
+    if not checkpoint is None:
+        checkpoint.finish()
+    execution['downstream']['repository'].synced()
+    execution['upstream']['repository'].synced()
+    return summary
+
+def resume_sync(execution, started, report, unlinked):
+    """
+    Finish a sync interrupted after it began writing, as found by
+    Checkpoint.pending: write back the associations of the upstream tasks it
+    created, then make the writes it hadn't. Only those tasks are loaded.
+    """
+    logger.info("Resuming an interrupted sync: %d associations and %d writes.",
+            len(unlinked), sum(len(report[d]['actions']) for d in report))
+    __link(execution, unlinked, execution.get('state', None))
+    upstream_q, downstream_q = restore(execution, report)
+    return apply_sync(execution, upstream_q, downstream_q, started)
+
+
+def __load_tasks(execution, state):
+    """
+    Load the downstream tasks, indexed by association, and the upstream
+    tasks. Both sides load at the same time: the upstream tasks in the
+    background while the downstream tasks load. When a previous sync has
+    been recorded, only the tasks changed since are loaded, along with the
+    counterparts of those tasks on the other side.
+    """
+    drepo = execution['downstream']['repository']
+    urepo = execution['upstream']['repository']
+
+    since = None if state is None else state.last_synced()
+    if since is None:
+        utasks, stop = __stream(urepo.all)
+        try:
+            dtasks, associations = __index_associations(drepo.all())
+        except:
+            stop()
+            raise
+        return dtasks, associations, utasks
+
+    logger.debug("Loading changes since %s.", since)
+    with ThreadPoolExecutor(max_workers=1) as background:
+        loading = background.submit(lambda: set(urepo.modified_since(since)))
+        dtasks = set(t for t in drepo.modified_since(since)
+                if not state.is_echo(t))
+        utasks = loading.result()
+
+    known_utasks = set((t.provider, t.uid) for t in utasks)
+    missing_utasks = set(uid
+            for t in dtasks
+            for (provider, uid) in t.associations.items()
+            if not (provider, uid) in known_utasks)
+
+    known_dtasks = set(t.uid for t in dtasks)
+    missing_dtasks = set(state.downstream_uid(t.provider, t.uid) for t in utasks)
+    missing_dtasks.discard(None)
+    missing_dtasks.difference_update(known_dtasks)
+
+    with ThreadPoolExecutor(max_workers=1) as background:
+        loading = None
+        if len(missing_utasks) > 0:
+            loading = background.submit(urepo.get, missing_utasks)
+        if len(missing_dtasks) > 0:
+            dtasks.update(drepo.get(missing_dtasks))
+        if not loading is None:
+            utasks.update(loading.result())
+    logger.debug("Loaded %d downstream and %d upstream changes.",
+            len(dtasks), len(utasks))
+    dtasks, associations = __index_associations(dtasks)
+    return dtasks, associations, utasks
+
+
+def __index_associations(dtasks):
+    """
+    Collect the downstream tasks, as they load, into a set and an index by
+    (provider, upstream uid), so each upstream task can find its associated
+    downstream tasks without a full scan.
+    """
+    tasks = set()
+    index = {}
+    for dtask in dtasks:
+        if dtask in tasks:
+            continue
+        tasks.add(dtask)
+        for association in dtask.associations.items():
+            index.setdefault(association, []).append(dtask)
+    return tasks, index
+
+def __stream(load):
+    """
+    Start loading tasks in the background, returning an iterator over them
+    in the order they load, and a function to stop loading them. Tasks are handed over in chunks through a
+    bounded queue, so a slow consumer holds back the loading rather than
+    letting it fill memory.
+    """
+    chunks = queue.Queue(maxsize=_STREAM_CHUNKS)
+    stopped = threading.Event()
+    done = object()
+    failure = []
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        chunk = []
+        try:
+            for task in load():
+                chunk.append(task)
+                if len(chunk) >= _STREAM_CHUNK_SIZE:
+                    put(chunk)
+                    chunk = []
+            put(chunk)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            put(done)
+
+    def consume():
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is done:
+                    break
+                for task in chunk:
+                    yield task
+            if len(failure) > 0:
+                raise failure[0]
+        finally:
+            # Let an abandoned producer finish instead of waiting on us.
+            stopped.set()
 
+    producer = threading.Thread(target=produce, name='tasksync-load')
+    producer.daemon = True
+    producer.start()
+    return consume(), stopped.set
+
+def __link(execution, unlinked, state):
+    """ Write back the associations of upstream tasks created earlier. """
+    if len(unlinked) == 0:
+        return
+    drepo = execution['downstream']['repository']
+    urepo = execution['upstream']['repository']
+    dtasks = {t.uid:t for t in drepo.get(set(d for (d, _) in unlinked))}
+    utasks = {t.uid:t for t in urepo.get(set(u for (_, u) in unlinked))}
+
+    batch = drepo.batch_open()
+    for (duid, uuid) in unlinked:
+        dtask = dtasks.get(duid, None)
+        utask = utasks.get(uuid, None)
+        if dtask is None or utask is None:
+            logger.warning("Can't associate %s with %s, which no longer exists.",
+                    duid, uuid)
+            continue
+        elif not dtask.association is None:
+            continue
+        logger.info("Associating %s with %s.", dtask, utask)
+        dtask.copy_from(utask)
+        drepo.save(dtask, batch, lambda d, u: __record(state, d, u), utask)
+    drepo.batch_close(batch)
 
-def __delete_orphan(dest, dest_batch, dest_task):
+def __progress(checkpoint, direction):
+    """ A callback recording the writes of a direction's planned actions. """
+    if checkpoint is None:
+        return lambda index, event, uid=None: None
+    return lambda index, event, uid=None: checkpoint.outcome(
+            direction, index, event, uid)
+
+def __delete_orphan(dest, dest_batch, dest_task, state, done):
     if not dest['delete_orphans']:
         logger.info("Skipping orphan, %s.", dest_task)
         return False
     logger.info("Deleting orphan for %s.", dest_task)
-    dest['repository'].delete(dest_task, dest_batch, None, None)
+    dest['repository'].delete(dest_task, dest_batch,
+            lambda t, u: done('deleted'), None)
+    if not state is None:
+        state.forget(dest_task)
     return True
 
-def __sync_task(source, source_batch, source_task, dest, dest_batch, dest_task):
+def __record(state, task_a, task_b):
+    if state is None:
+        return
+    if isinstance(task_a, DownstreamTask):
+        state.record(task_a, task_b)
+    else:
+        state.record(task_b, task_a)
+
+def __sync_task(source, source_batch, source_task, dest, dest_batch, dest_task,
+        state, done):
     dest_task.copy_from(source_task)
 
     task_cb = dest['cb']
@@ -83,27 +328,64 @@ def __sync_task(source, source_batch, source_task, dest, dest_batch, dest_task):
         task_cb(source_task, dest_task)
 
     def task_created(dest_task, source_task):
+        done('saved', dest_task.uid)
         if not isinstance(source_task, DownstreamTask):
             # A sync is only required when the source is a downstream task.
+            __record(state, dest_task, source_task)
             return
         logger.info("Successfully synced %s->%s.", source_task, dest_task)
         if source_task.association is None:
+            def linked(source_task, dest_task):
+                done('linked', source_task.uid)
+                __record(state, source_task, dest_task)
             source_task.copy_from(dest_task)
-            source['repository'].save(source_task, source_batch, None, None)
+            source['repository'].save(source_task, source_batch, linked,
+                    dest_task)
+        else:
+            __record(state, source_task, dest_task)
 
     dest['repository'].save(dest_task, dest_batch, task_created, source_task)
 
-def __sync_tasks(source, dest, queue):
+def __unchanged(source, source_task, dest, dest_batch, dest_task, state, done):
+    """
+    Identifies if the destination already shows what the source does, in
+    which case no write is made. A downstream task only has its recorded
+    etag brought up to date, so it isn't seen as stale again.
+    """
+    if dest_task.fingerprint != source_task.fingerprint:
+        return False
+
+    if isinstance(dest_task, DownstreamTask):
+        logger.debug("Updating etag only for %s->%s.", source_task, dest_task)
+        def saved(dest_task, source_task):
+            done('saved', dest_task.uid)
+            __record(state, dest_task, source_task)
+        dest_task.associate_with(source_task)
+        dest['repository'].save(dest_task, dest_batch, saved, source_task)
+    else:
+        logger.debug("Skipping unchanged %s->%s.", source_task, dest_task)
+        __record(state, source_task, dest_task)
+    return True
+
+def __sync_tasks(source, dest, queue, state, progress):
+    """
+    Sync each (source, dest) pair in the queue, returning counts of the
+    tasks saved, deleted and skipped because nothing visible changed. Each
+    write that lands is reported to 'progress' with the pair's position.
+    """
+    counts = {'saved':0, 'deleted':0, 'skipped':0}
     if(len(queue) < 1):
-        return
+        return counts
 
     source_batch = source['repository'].batch_open()
 
     dest_batch = dest['repository'].batch_open()
-    for (source_task, dest_task) in queue:
+    for (index, (source_task, dest_task)) in enumerate(queue):
+        done = lambda event, uid=None, index=index: progress(index, event, uid)
         if source_task is None or source_task.is_deleted:
             logger.info("Identified orphan for %s.", dest_task)
-            __delete_orphan(dest, dest_batch, dest_task)
+            if __delete_orphan(dest, dest_batch, dest_task, state, done):
+                counts['deleted'] += 1
             continue
         elif dest_task is None:
             # The destination task isn't known. It's either orphaned or new.
@@ -118,10 +400,15 @@ def __sync_tasks(source, dest, queue):
         if not task_filter is None and not task_filter(source_task, dest_task):
             logger.debug("Skipping sync for %s->%s", source_task, dest_task)
             continue
+        elif not dest_task.uid is None and __unchanged(source, source_task,
+                dest, dest_batch, dest_task, state, done):
+            counts['skipped'] += 1
         else:
             logger.info("Syncing %s->%s", source_task, dest_task)
             __sync_task(source, source_batch, source_task,
-                    dest, dest_batch, dest_task)
+                    dest, dest_batch, dest_task, state, done)
+            counts['saved'] += 1
 
     dest['repository'].batch_close(dest_batch)
     source['repository'].batch_close(source_batch)
+    return counts
@@ -17,15 +17,25 @@
 
 """ Tasks. """
 import abc
+import hashlib
 
 class DownstreamTask(object):
     """ Identifies this instance is a data sync. """
+    __slots__ = ()
 
     @abc.abstractproperty
     def association(self):
         """ Get the unique association identifier for this task. """
         raise NotImplementedError
 
+    @abc.abstractproperty
+    def associations(self):
+        """
+        Get a dict of upstream provider names to the upstream identifier
+        this task is associated with.
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def is_associated_with(self, upstream):
         """ Identify if this task is associated with an upstream task. """
@@ -42,6 +52,7 @@ class UpstreamTask(object):
     actual association values should be globally unique an should
     withstand long-term retention.
     """
+    __slots__ = ()
 
     @abc.abstractproperty
     def uid(self):
@@ -55,7 +66,11 @@ class UpstreamTask(object):
 
 class Task(object):
     #pylint: disable=E0202
-    """ An abstract task representation. """
+    """
+    An abstract task representation. Subclasses declare __slots__, as a
+    sync may hold hundreds of thousands of tasks.
+    """
+    __slots__ = ()
 
     def __str__(self):
         return "%s[id=%s,s=%s]" % (
@@ -119,6 +134,30 @@ class Task(object):
         return self.status == 'deleted'
 
 
+    @property
+    def fingerprint(self):
+        """
+        A digest of the user-visible fields, normalized so that equivalent
+        tasks from different providers share a fingerprint. Google keeps
+        only the date of a due date, so only the date is considered.
+        """
+        if self.is_completed:
+            status = 'completed'
+        elif self.is_deleted:
+            status = 'deleted'
+        else:
+            status = 'pending'
+        due = self.due
+        completed = self.completed
+        fields = (
+            (self.subject or '').strip(),
+            status,
+            '' if due is None else due.strftime('%Y-%m-%d'),
+            '' if completed is None else completed.strftime('%Y-%m-%dT%H:%M:%S'),
+        )
+        return hashlib.sha1('\x1f'.join(fields).encode('utf-8')).hexdigest()
+
+
     @abc.abstractmethod
     def should_sync(self):
         raise NotImplementedError
@@ -147,10 +186,56 @@ class TaskFactory(object):
         raise NotImplementedError
 
 class TaskRepository(object):
+    @property
+    def resource(self):
+        """
+        Identifies the store behind this repository. Executions whose
+        repositories share a store are never run at the same time. By
+        default, only the repository itself is shared.
+        """
+        return self
+
+    def watched_paths(self):
+        """
+        Files that change whenever the repository's tasks change. Without
+        any, changes can only be found by polling.
+        """
+        return []
+
+    @property
+    def quota(self):
+        """ The API quota the repository's calls count against, if any. """
+        return None
+
+    def synced(self):
+        """ Called once a sync of this repository has completed. """
+        pass
+
     def all(self):
         """ Load all tasks. """
         raise NotImplementedError
 
+    def modified_since(self, since):
+        """
+        Load the tasks changed, including those deleted, since the specified
+        UTC datetime. Repositories that can't tell what changed load all.
+        """
+        return self.all()
+
+    def get(self, uids):
+        """ Load the tasks with the specified uids, skipping unknown uids. """
+        uids = set(uids)
+        return [t for t in self.all() if t.uid in uids]
+
+    def estimate(self, saves, deletes):
+        """
+        Estimate the cost of saving and deleting the specified number of
+        tasks, as a dict of the API calls, `task` subprocesses and batches
+        it would take.
+        """
+        return {'api_calls':0, 'subprocesses':0,
+                'batches':0 if saves + deletes == 0 else 1}
+
     def batch_open(self):
         raise NotImplementedError
 
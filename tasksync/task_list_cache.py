@@ -0,0 +1,57 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+""" The Google task lists of an account, kept between runs. """
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class TaskListCache(object):
+    """
+    A JSON file holding a directory of task lists: the ids of every list by
+    title, the etag they were listed with, if any, and when (in seconds
+    since the epoch) they were listed.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.expanduser(path)
+
+    def load(self):
+        """ The cached directory, or None if nothing usable is cached. """
+        try:
+            with open(self._path) as f:
+                directory = json.load(f)
+        except (IOError, ValueError) as e:
+            if os.path.exists(self._path):
+                logger.warning("Ignoring unreadable task list cache: %s", e)
+            return None
+        if not all(k in directory for k in ('lists', 'etag', 'fetched')):
+            return None
+        return directory
+
+    def store(self, directory):
+        """ Replace the cached directory. """
+        temp = self._path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(directory, f, sort_keys=True)
+        # Readers only ever see a whole directory.
+        os.rename(temp, self._path)
+
+    def clear(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
@@ -15,19 +15,34 @@
 # You should have received a copy of the GNU General Public License
 # along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
 from tasksync.task import Task, DownstreamTask, TaskFactory, TaskRepository
+from tasksync.journal import Journal
+from tasksync import dates
+from tasksync.taskwarrior_data import TaskWarriorDataReader
 
-from datetime import datetime
 from taskw import TaskWarrior
 
+import itertools
+import json
 import logging
+import os
+import tempfile
+import uuid
 logger = logging.getLogger(__name__)
 
 class TaskWarriorTask(Task, DownstreamTask):
-    """ Represents a TaskWarrior task. """
+    """
+    Represents a TaskWarrior task. The fingerprint is kept until the task
+    changes through copy_from or its _source is replaced.
+    """
     __UDA_NAMESPACE = "tasksync"
     __UDA_ASSOCIATION = "%s_assoc" % __UDA_NAMESPACE
     __UDA_ETAG = "%s_etag" % __UDA_NAMESPACE
 
+    __slots__ = ('__source', '_fingerprint')
+
+    # Association keys, by provider.
+    __ASSOCIATION_KEYS = {}
+
     def __init__(self, source):
         super(TaskWarriorTask, self).__init__()
         self._source = source
@@ -41,7 +56,7 @@ class TaskWarriorTask(Task, DownstreamTask):
         if not TaskWarriorTask.__UDA_ETAG in self._source:
             # Is local only. Couldn't possibly be upstream.
             return False
-        return self._source[TaskWarriorTask.__UDA_ETAG].replace('&dquot;', '"') != other.etag
+        return self.etag != other.etag
 
     def copy_from(self, other):
         if other is None:
@@ -53,6 +68,7 @@ class TaskWarriorTask(Task, DownstreamTask):
         dfmt = self.__format_date # Format callback.
         self.__set_or_delete('due', other.due, fmt=dfmt)
         self.__set_or_delete('end', other.completed, fmt=dfmt)
+        self._fingerprint = None
 
         self.associate_with(other)
 
@@ -84,7 +100,10 @@ class TaskWarriorTask(Task, DownstreamTask):
 
     @property
     def etag(self):
-        return self._source.get(TaskWarriorTask.__UDA_ETAG)
+        etag = self._source.get(TaskWarriorTask.__UDA_ETAG)
+        if etag is None:
+            return None
+        return etag.replace('&dquot;', '"')
 
     @property
     def status(self):
@@ -98,6 +117,15 @@ class TaskWarriorTask(Task, DownstreamTask):
     def subject(self):
         return self._source['description']
 
+    @property
+    def _source(self):
+        return self.__source
+
+    @_source.setter
+    def _source(self, source):
+        self.__source = source
+        self._fingerprint = None
+
     @property
     def due(self):
         return self.__parse_date(self._source.get('due', None))
@@ -106,6 +134,12 @@ class TaskWarriorTask(Task, DownstreamTask):
     def completed(self):
         return self.__parse_date(self._source.get('end', None))
 
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = super(TaskWarriorTask, self).fingerprint
+        return self._fingerprint
+
     @property
     def annotations(self):
         """ Gets a dict of annotations. """
@@ -123,6 +157,14 @@ class TaskWarriorTask(Task, DownstreamTask):
                 return self._source[key]
         return None
 
+    @property
+    def associations(self):
+        """ Gets a dict of upstream providers to upstream identifiers. """
+        prefix = "%s_" % TaskWarriorTask.__UDA_ASSOCIATION
+        return {k[len(prefix):]:v
+                for k, v in self._source.items()
+                if k.startswith(prefix)}
+
     def is_associated_with(self, other):
         """ Identifies if this task is associated with the specified task. """
         association_key = self._association_key_for(other)
@@ -138,18 +180,20 @@ class TaskWarriorTask(Task, DownstreamTask):
 
     def _association_key_for(self, upstream):
         """ Generate the association key for the upstream. """
-        return "%s_%s" % (TaskWarriorTask.__UDA_ASSOCIATION, upstream.provider)
+        provider = upstream.provider
+        key = TaskWarriorTask.__ASSOCIATION_KEYS.get(provider, None)
+        if key is None:
+            key = "%s_%s" % (TaskWarriorTask.__UDA_ASSOCIATION, provider)
+            TaskWarriorTask.__ASSOCIATION_KEYS[provider] = key
+        return key
 
     def __parse_date(self, as_string):
         if as_string is None:
             return None
-        if as_string.isdigit():
-            return datetime.fromtimestamp(int(as_string))
-        else:
-            return datetime.strptime(as_string, '%Y%m%dT%H%M%SZ')
+        return dates.parse_taskwarrior(as_string)
 
     def __format_date(self, as_timestamp):
-        return datetime.strftime(as_timestamp, '%s')
+        return dates.format_taskwarrior(as_timestamp)
 
     def __set_or_delete(self, key, value, fmt=None):
         if value is None:
@@ -164,7 +208,10 @@ class TaskWarriorTaskFactory(TaskFactory):
     def create_from(self, **kwargs):
         """ Create a new task from another task, 'other', or a map, 'map'. """
         if 'map' in kwargs:
-            return TaskWarriorTask(kwargs['map'].copy())
+            # A caller handing over a map it won't use again may skip the copy.
+            source = kwargs['map']
+            return TaskWarriorTask(source.copy() if kwargs.get('copy', True)
+                    else source)
 
         elif 'other' in kwargs:
             task = TaskWarriorTask({'status':'pending'})
@@ -174,19 +221,112 @@ class TaskWarriorTaskFactory(TaskFactory):
         raise KeyError('Either a map or task argument must be provided.')
 
 class TaskWarriorTaskRepository(TaskRepository):
-    def __init__(self, factory, db=None, **kwargs):
+    # Bounds the length of a single `task` command line.
+    __GET_CHUNK = 200
+
+    # Attributes that are reported by `task export` but may not be imported.
+    __READ_ONLY = ('id', 'urgency')
+
+    def __init__(self, factory, db=None, bulk=False, data_location=None,
+            journal=None, **kwargs):
+        """
+        With 'bulk', a batch is written with a single `task import` and one
+        `task done` and `task delete` each, rather than a command per task.
+
+        With a 'data_location', all tasks are read directly from the data
+        files in that directory rather than exported through `task`.
+
+        With a 'journal', the path of the journal written by the hooks in
+        tasksync/hooks, the tasks changed since the last sync are read from
+        the journal, which is compacted once a sync has completed.
+        """
         self._db = db or TaskWarrior(config_filename=kwargs['config'])
         self._factory = factory
+        self._bulk = bulk
+        self._data_location = data_location
+        self._reader = None
+        if not data_location is None:
+            self._reader = TaskWarriorDataReader(data_location)
+        self._journal = None
+        self._journal_offset = 0
+        if not journal is None:
+            self._journal = Journal(journal)
+
+    @property
+    def resource(self):
+        location = self.__location()
+        if location is None:
+            return super(TaskWarriorTaskRepository, self).resource
+        return ('taskwarrior', location)
+
+    def watched_paths(self):
+        location = self.__location()
+        if location is None:
+            return []
+        paths = [os.path.join(location, f)
+                for f in ('pending.data', 'completed.data')]
+        if not self._journal is None:
+            paths.append(self._journal.path)
+        return paths
 
     def all(self):
+        if not self._journal is None:
+            # Everything journaled so far is about to be read.
+            self._journal_offset = self._journal.read()[1]
+        if not self._reader is None:
+            return (self._factory.create_from(map=t, copy=False)
+                    for t in self._reader.tasks())
         wtasks = self._db.load_tasks()
-        wtasks = sum(wtasks.values(), [])
-        return [self._factory.create_from(map=t) for t in wtasks]
+        wtasks = itertools.chain.from_iterable(wtasks.values())
+        return [self._factory.create_from(map=t, copy=False) for t in wtasks]
+
+    def modified_since(self, since):
+        if not self._journal is None and self._journal.exists():
+            wtasks, self._journal_offset = self._journal.read()
+            return [self._factory.create_from(map=t, copy=False)
+                    for t in wtasks.values()]
+        wtasks = self._db.filter_tasks(
+                {'modified.after':dates.format_taskwarrior_iso(since)})
+        return [self._factory.create_from(map=t, copy=False) for t in wtasks]
+
+    def get(self, uids):
+        uids = list(uids)
+        tasks = []
+        for i in range(0, len(uids), self.__GET_CHUNK):
+            chunk = uids[i:i + self.__GET_CHUNK]
+            wtasks = self._db.filter_tasks({'or':[('uuid', u) for u in chunk]})
+            tasks += [self._factory.create_from(map=t, copy=False)
+                    for t in wtasks]
+        return tasks
+
+    def synced(self):
+        if not self._journal is None:
+            self._journal.compact(self._journal_offset)
+            self._journal_offset = 0
+
+    def estimate(self, saves, deletes):
+        if saves + deletes == 0:
+            return {'api_calls':0, 'subprocesses':0, 'batches':0}
+        elif not self._bulk:
+            # taskw reads a task back before and after changing it.
+            return {'api_calls':0, 'subprocesses':3 * (saves + deletes),
+                    'batches':1}
+
+        chunks = lambda n: (n + self.__GET_CHUNK - 1) // self.__GET_CHUNK
+        # One import, then, per chunk of uuids, an export to read the writes
+        # back, at most one `task done` and one `task delete`.
+        subprocesses = (1 if saves > 0 else 0) + 2 * chunks(saves)\
+                + chunks(deletes)
+        return {'api_calls':0, 'subprocesses':subprocesses, 'batches':1}
 
     def batch_open(self):
         return {'count':0, 'create':[], 'update':[], 'delete':[]}
 
     def batch_close(self, batch):
+        if self._bulk:
+            self.__batch_close_bulk(batch)
+            return
+
         for (m, c, u) in batch['create']:
             self._close(self._db.task_add(**m), c, u)
 
@@ -199,11 +339,80 @@ class TaskWarriorTaskRepository(TaskRepository):
             if not c is None:
                 c(None, u)
 
+    def __batch_close_bulk(self, batch):
+        writes = batch['create'] + batch['update']
+        for (m, _, _) in batch['create']:
+            # Imported tasks keep their uuid, so new ones can be found again.
+            m['uuid'] = str(uuid.uuid4())
+
+        if len(writes) > 0:
+            self.__import([m for (m, _, _) in writes])
+
+        done = [m['uuid'] for (m, _, _) in writes
+                if self.__should_complete(self._factory.create_from(map=m))]
+        self.__execute_for(done, 'done')
+        self.__execute_for([m['uuid'] for (m, _, _) in batch['delete']], 'delete')
+
+        written = {t.uid:t for t in self.get(m['uuid'] for (m, _, _) in writes)}
+        for (m, c, u) in writes:
+            task = written.get(m['uuid'], None)
+            if task is None:
+                logger.error("Couldn't find %s after import.", m['uuid'])
+            elif not c is None:
+                c(task, u)
+
+        for (m, c, u) in batch['delete']:
+            if not c is None:
+                c(None, u)
+
+    def __import(self, maps):
+        """ Create or update the tasks in a single `task import`. """
+        payload = [self.__importable(m) for m in maps]
+        (fd, path) = tempfile.mkstemp(prefix='tasksync-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(payload, f)
+            logger.debug("Importing %d tasks.", len(payload))
+            self._db._execute('import', path)
+        finally:
+            os.remove(path)
+
+    def __importable(self, source):
+        task = {}
+        for key, value in source.items():
+            if key in TaskWarriorTaskRepository.__READ_ONLY:
+                continue
+            if key in ('due', 'end') and value.isdigit():
+                # Import only understands ISO dates, not epoch timestamps.
+                value = dates.format_taskwarrior_iso(value)
+            task[key] = value
+        return task
+
+    def __execute_for(self, uuids, command):
+        """ Run a command against many tasks, in as few calls as possible. """
+        for i in range(0, len(uuids), self.__GET_CHUNK):
+            chunk = uuids[i:i + self.__GET_CHUNK]
+            logger.debug("Running %s for %d tasks.", command, len(chunk))
+            # rc.bulk=0 stops TaskWarrior from confirming bulk changes.
+            self._db._execute('rc.bulk=0', *(chunk + [command]))
+
+    def __location(self):
+        """ The directory holding the data files, if known. """
+        location = self._data_location
+        if location is None:
+            location = self._db.config.get('data', {}).get('location', None)
+        if location is None:
+            return None
+        return os.path.realpath(os.path.expanduser(location))
+
+    def __should_complete(self, task):
+        return task.is_pending and not task.completed is None
+
     def _close(self, source, cb, userdata):
         task = self._factory.create_from(map=source)
 
         # Task completion is a special case.
-        if task.is_pending and not task.completed is None:
+        if self.__should_complete(task):
             logger.info("Marking %s as complete.", task)
             task._source = self._db.task_done(uuid=task._source['uuid'])
 
@@ -214,7 +423,6 @@ class TaskWarriorTaskRepository(TaskRepository):
         batch['delete'].append((task._source, cb, userdata))
 
     def save(self, task, batch, cb, userdata):
-        pass
         if task.uid is None:
             batch['create'].append((task._source, cb, userdata))
         else:
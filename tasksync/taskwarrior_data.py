@@ -0,0 +1,105 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+""" Reads TaskWarrior's data files without going through `task`. """
+from tasksync import dates
+
+import json
+import logging
+import mmap
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# One attribute of a record, e.g. description:"Stuff".
+_ATTRIBUTE = re.compile(br'([^\s\[\]:]+):"((?:[^"\\]|\\.)*)"')
+
+# Legacy entities still written by some versions of TaskWarrior.
+_ENTITIES = (('&dquot;', '"'), ('&open;', '['), ('&close;', ']'))
+
+_DATES = ('entry', 'start', 'end', 'due', 'until', 'wait', 'modified',
+        'scheduled')
+
+# The statuses reported by `task export` for pending and completed tasks.
+_STATUSES = ('pending', 'waiting', 'completed')
+
+class TaskWarriorDataReader(object):
+    """
+    Streams the records of pending.data and completed.data through a
+    memory map, converted to the form `task export` reports. Completed
+    tasks were never synced unless they carry an association, so completed
+    records without one are skipped before being parsed.
+    """
+
+    def __init__(self, data_location, association_prefix='tasksync_assoc_'):
+        self._data_location = os.path.expanduser(data_location)
+        self._association_prefix = association_prefix.encode('utf-8')
+
+    def tasks(self):
+        """ Lazily read every pending and synced completed task. """
+        for record in self.__records('pending.data'):
+            yield record
+        for record in self.__records('completed.data', associated_only=True):
+            yield record
+
+    def __records(self, name, associated_only=False):
+        path = os.path.join(self._data_location, name)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for line in iter(data.readline, b''):
+                    if associated_only and not self._association_prefix in line:
+                        continue
+                    record = parse(line)
+                    if record.get('status', None) in _STATUSES:
+                        yield record
+            finally:
+                data.close()
+
+def parse(line):
+    """ Parse a single data file record into a task map. """
+    record = {}
+    annotations = []
+    for (key, value) in _ATTRIBUTE.findall(line):
+        key = key.decode('utf-8')
+        value = _decode(value)
+        if key.startswith('annotation_'):
+            annotations.append({
+                'entry':_format_date(key[len('annotation_'):]),
+                'description':value})
+        elif key in ('tags', 'depends'):
+            record[key] = value.split(',')
+        elif key in _DATES:
+            record[key] = _format_date(value)
+        else:
+            record[key] = value
+
+    if len(annotations) > 0:
+        record['annotations'] = annotations
+    return record
+
+def _decode(value):
+    value = json.loads(b'"' + value + b'"', strict=False)
+    for (entity, character) in _ENTITIES:
+        value = value.replace(entity, character)
+    return value
+
+def _format_date(epoch):
+    return dates.format_taskwarrior_iso(epoch)
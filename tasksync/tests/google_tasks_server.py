@@ -0,0 +1,379 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A local stand-in for the parts of the Google Tasks v1 API that tasksync
+uses: tasklists.list, tasks.list (with paging), get, insert, update, patch,
+delete and the /batch endpoint. As Google does, responses are reduced to
+a 'fields' mask when one is given, and gzipped for clients that accept gzip
+and say so in their User-Agent. Latency, rate limiting (429) and server
+errors (503) can be injected. Point ApiClient at it with api_root:
+
+    python -m tasksync.tests.google_tasks_server --port 8080 --latency 0.1
+"""
+from tasksync.google_tasks import discovery_document
+
+from datetime import datetime
+from email.parser import BytesParser, Parser
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+import argparse
+import gzip
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+_TASKLISTS = re.compile(r'^/tasks/v1/users/@me/lists$')
+_TASKS = re.compile(r'^/tasks/v1/lists/([^/]+)/tasks$')
+_TASK = re.compile(r'^/tasks/v1/lists/([^/]+)/tasks/([^/]+)$')
+
+_REASONS = {200:'OK', 204:'No Content', 400:'Bad Request', 404:'Not Found',
+        429:'Too Many Requests', 503:'Service Unavailable'}
+
+_MAX_RESULTS = 100
+
+class GoogleTasksServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves an in-memory task store. Every API request (and every part of a
+    batch) is delayed by 'latency' seconds, and fails with 429 or 503 with
+    a probability of 'rate_limit' or 'error_rate'. Throttled responses carry
+    a Retry-After of 'retry_after' seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, rate_limit=0.0,
+            error_rate=0.0, retry_after=1, seed=None):
+        HTTPServer.__init__(self, address, _Handler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lists = {}
+        self.stats = {'requests':0, 'operations':0, 'batches':0,
+                'throttled':0, 'errors':0, 'bytes_in':0, 'bytes_out':0}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def root_url(self):
+        return 'http://%s:%d/' % self.server_address[:2]
+
+    def start(self):
+        """ Serve from a background thread. """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if not self._thread is None:
+            self._thread.join()
+
+    def add_list(self, title):
+        """ Add a task list, returning its id. """
+        with self._lock:
+            list_id = 'l%d' % next(self._ids)
+            self.lists[list_id] = {'id':list_id, 'title':title,
+                    'etag':self.__etag(), 'updated':_now(), 'tasks':{}}
+            return list_id
+
+    def add_task(self, list_id, **fields):
+        """ Add a task to a list, returning the stored task. """
+        with self._lock:
+            return self.__store(list_id, fields)
+
+    def tasks(self, list_id):
+        """ The tasks of a list, including deleted ones. """
+        return list(self.lists[list_id]['tasks'].values())
+
+    def dispatch(self, method, target, body, sleep=True):
+        """
+        Handle one request, returning (status, headers, body) where body is
+        a dict, or None.
+        """
+        url = urlparse(target)
+        if method == 'GET' and url.path == '/discovery/v1/apis/tasks/v1/rest':
+            document = discovery_document()
+            document['rootUrl'] = self.root_url
+            return 200, {}, document
+
+        if sleep and self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.stats['operations'] += 1
+            roll = self._random.random()
+            if roll < self.rate_limit:
+                self.stats['throttled'] += 1
+                return 429, {'Retry-After':str(self.retry_after)},\
+                        _error(429, 'rateLimitExceeded')
+            elif roll < self.rate_limit + self.error_rate:
+                self.stats['errors'] += 1
+                return 503, {}, _error(503, 'backendError')
+
+            query = {k:v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, headers, payload = self.__route(method, url.path,
+                        query, body)
+                if 'fields' in query and not payload is None:
+                    payload = _project(payload, _fields(query['fields']))
+                return status, headers, payload
+            except KeyError:
+                return 404, {}, _error(404, 'notFound')
+            except ValueError as e:
+                return 400, {}, _error(400, str(e))
+
+    def __route(self, method, path, query, body):
+        if _TASKLISTS.match(path) and method == 'GET':
+            items = [{k:v for k, v in l.items() if k != 'tasks'}
+                    for l in self.lists.values()]
+            return 200, {}, _page('tasks#taskLists', items, query)
+
+        match = _TASKS.match(path)
+        if match and method == 'GET':
+            tasks = self.lists[match.group(1)]['tasks'].values()
+            tasks = [t for t in tasks if _visible(t, query)]
+            return 200, {}, _page('tasks#tasks', tasks, query)
+        elif match and method == 'POST':
+            return 200, {}, self.__store(match.group(1), _loads(body))
+
+        match = _TASK.match(path)
+        if match:
+            tasks = self.lists[match.group(1)]['tasks']
+            task = tasks[match.group(2)]
+            if method == 'GET':
+                return 200, {}, task
+            elif task.get('deleted', False):
+                raise KeyError(match.group(2))
+            elif method == 'PUT':
+                fields = _loads(body)
+                fields['id'] = task['id']
+                tasks[task['id']] = {}
+                return 200, {}, self.__store(match.group(1), fields)
+            elif method == 'PATCH':
+                fields = dict(task)
+                fields.update(_loads(body))
+                return 200, {}, self.__store(match.group(1),
+                        {k:v for k, v in fields.items() if not v is None})
+            elif method == 'DELETE':
+                task['deleted'] = True
+                task['etag'] = self.__etag()
+                task['updated'] = _now()
+                return 204, {}, None
+
+        raise KeyError(path)
+
+    def __store(self, list_id, fields):
+        tasks = self.lists[list_id]['tasks']
+        task = dict(fields)
+        task.setdefault('id', 't%d' % next(self._ids))
+        task.setdefault('status', 'needsAction')
+        task.update({'kind':'tasks#task', 'etag':self.__etag(),
+            'updated':_now(), 'selfLink':'%stasks/v1/lists/%s/tasks/%s' % (
+                self.root_url, list_id, task['id'])})
+        tasks[task['id']] = task
+        return task
+
+    def __etag(self):
+        return '"%s"' % uuid.uuid4().hex
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.__handle()
+
+    def do_POST(self):
+        self.__handle()
+
+    def do_PUT(self):
+        self.__handle()
+
+    def do_PATCH(self):
+        self.__handle()
+
+    def do_DELETE(self):
+        self.__handle()
+
+    def __handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else b''
+        self.server.stats['requests'] += 1
+        self.server.stats['bytes_in'] += length
+
+        if self.command == 'POST' and self.path.split('?')[0] == '/batch':
+            self.__batch(body)
+            return
+
+        status, headers, payload = self.server.dispatch(
+                self.command, self.path, body)
+        content = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        if len(content) > 0:
+            headers['Content-Type'] = 'application/json; charset=UTF-8'
+        self.__respond(status, headers, content)
+
+    def __batch(self, body):
+        self.server.stats['batches'] += 1
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+
+        content_type = self.headers.get('Content-Type')
+        message = BytesParser().parsebytes(
+                b'Content-Type: ' + content_type.encode('utf-8') + b'\r\n\r\n' + body)
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            if isinstance(request, list):
+                request = request[0].as_string()
+            request_line, request = request.split('\n', 1)
+            method, target, _ = request_line.strip().split(' ', 2)
+            sub = Parser().parsestr(request)
+            status, headers, payload = self.server.dispatch(
+                    method, target, sub.get_payload().encode('utf-8'), sleep=False)
+
+            lines = ['HTTP/1.1 %d %s' % (status, _REASONS.get(status, ''))]
+            lines += ['%s: %s' % (k, v) for k, v in headers.items()]
+            content = '' if payload is None else json.dumps(payload)
+            if len(content) > 0:
+                lines.append('Content-Type: application/json; charset=UTF-8')
+            lines.append('Content-Length: %d' % len(content.encode('utf-8')))
+            lines += ['', content]
+
+            content_id = part['Content-ID']
+            parts.append('\r\n'.join([
+                '--%s' % boundary,
+                'Content-Type: application/http',
+                'Content-ID: <response-%s' % content_id[1:],
+                '',
+                '\r\n'.join(lines),
+            ]))
+        parts.append('--%s--' % boundary)
+        content = '\r\n'.join(parts).encode('utf-8')
+        self.__respond(200, {'Content-Type':'multipart/mixed; boundary=%s' % boundary},
+                content)
+
+    def __respond(self, status, headers, content):
+        if len(content) > 0\
+                and 'gzip' in self.headers.get('Accept-Encoding', '')\
+                and 'gzip' in self.headers.get('User-Agent', ''):
+            content = gzip.compress(content)
+            headers = dict(headers, **{'Content-Encoding':'gzip'})
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.stats['bytes_out'] += len(content)
+
+def _visible(task, query):
+    if task.get('deleted', False) and query.get('showDeleted') != 'true':
+        return False
+    if task['status'] == 'completed' and query.get('showCompleted') == 'false':
+        return False
+    if 'updatedMin' in query and task['updated'] < query['updatedMin']:
+        return False
+    return True
+
+def _fields(spec):
+    """
+    Parse a fields mask, e.g. "items(id,title),nextPageToken", into a dict
+    of names to the mask of their value, or None for the whole value.
+    """
+    mask = {}
+    stack = [mask]
+    name = ''
+    for c in spec + ',':
+        if c == '(':
+            stack[-1][name.strip()] = {}
+            stack.append(stack[-1][name.strip()])
+            name = ''
+        elif c in '),':
+            if len(name.strip()) > 0:
+                stack[-1][name.strip()] = None
+            if c == ')':
+                stack.pop()
+            name = ''
+        else:
+            name += c
+    return mask
+
+def _project(value, mask):
+    if mask is None:
+        return value
+    elif isinstance(value, list):
+        return [_project(v, mask) for v in value]
+    return {k:_project(value[k], m) for k, m in mask.items() if k in value}
+
+def _page(kind, items, query):
+    start = int(query.get('pageToken', 0))
+    size = min(int(query.get('maxResults', 20)), _MAX_RESULTS)
+    page = {'kind':kind, 'etag':'"%s"' % uuid.uuid4().hex,
+            'items':list(items)[start:start + size]}
+    if start + size < len(items):
+        page['nextPageToken'] = str(start + size)
+    return page
+
+def _loads(body):
+    if body is None or len(body) == 0:
+        raise ValueError('A body is required.')
+    return json.loads(body.decode('utf-8'))
+
+def _error(code, reason):
+    return {'error':{'code':code, 'message':reason,
+        'errors':[{'domain':'global', 'reason':reason, 'message':reason}]}}
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def main():
+    parser = argparse.ArgumentParser('google_tasks_server')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--lists', nargs='*', default=['@default'])
+    args = parser.parse_args()
+
+    server = GoogleTasksServer(('127.0.0.1', args.port), latency=args.latency,
+            rate_limit=args.rate_limit, error_rate=args.error_rate)
+    for title in args.lists:
+        server.add_list(title)
+    print("Serving on %s" % server.root_url)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
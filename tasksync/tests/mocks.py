@@ -97,6 +97,12 @@ class MockDownstreamTask(MockTask, DownstreamTask):
             return None
         return self.upstream.uid
 
+    @property
+    def associations(self):
+        if self.upstream is None:
+            return {}
+        return {self.upstream.provider: self.upstream.uid}
+
     def stale(self, other):
         return self._etag != other._etag
 
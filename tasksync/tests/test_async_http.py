@@ -0,0 +1,99 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.async_http import AsyncHttp
+
+import asyncio
+import gzip
+import unittest
+
+class TestAsyncHttp(unittest.TestCase):
+    def serve(self, responses, test):
+        """ Answer each request with the next response, then run the test. """
+        requests = []
+        async def handle(reader, writer):
+            while len(responses) > 0:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                requests.append(head)
+                response = responses.pop(0)
+                writer.write(response)
+                await writer.drain()
+                if b'Connection: close' in response:
+                    break
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await test('http://127.0.0.1:%d/path?q=1' % port)
+            finally:
+                server.close()
+        return asyncio.run(run()), requests
+
+    def test_connections_are_kept_alive(self):
+        http = AsyncHttp()
+        ok = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+        async def test(url):
+            return [await http.request('GET', url) for _ in range(0, 3)]
+        results, requests = self.serve([ok, ok, ok], test)
+
+        self.assertEqual([r[2] for r in results], [b'ok'] * 3)
+        self.assertEqual(http.stats['connections'], 1)
+        self.assertTrue(requests[0].startswith(b'GET /path?q=1 HTTP/1.1\r\n'))
+
+    def test_closed_connections_are_replaced(self):
+        http = AsyncHttp()
+        closing = b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 0\r\n\r\n'
+        async def test(url):
+            return [await http.request('GET', url) for _ in range(0, 2)]
+        results, _ = self.serve([closing, closing], test)
+
+        self.assertEqual([r[0] for r in results], [200, 200])
+        self.assertEqual(http.stats['connections'], 2)
+
+    def test_chunked_and_gzipped_content(self):
+        body = gzip.compress(b'{"items": []}')
+        chunked = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n'
+                b'Content-Encoding: gzip\r\n\r\n'
+                + b'%x\r\n' % 5 + body[:5] + b'\r\n'
+                + b'%x\r\n' % (len(body) - 5) + body[5:] + b'\r\n0\r\n\r\n')
+        async def test(url):
+            return await http.request('POST', url, body='{}')
+        http = AsyncHttp()
+        (status, headers, content), requests = self.serve([chunked], test)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertEqual(content, b'{"items": []}')
+        self.assertIn(b'Content-Length: 2\r\n', requests[0])
+
+    def test_requests_in_flight_are_bounded(self):
+        http = AsyncHttp(max_connections=2)
+        ok = b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n'
+        async def test(url):
+            return await asyncio.gather(
+                    *[http.request('GET', url) for _ in range(0, 6)])
+        results, _ = self.serve([ok] * 6, test)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(http.stats['connections'], 2)
@@ -0,0 +1,77 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from datetime import datetime
+from tasksync.checkpoint import Checkpoint
+
+import os
+import shutil
+import tempfile
+import unittest
+
+def action(action, source, dest):
+    return {'action':action, 'source':source, 'dest':dest}
+
+PLAN = {
+    'downstream':{'actions':[
+        action('update', 'u1', 'd1'),
+        action('delete', None, 'd2'),
+    ]},
+    'upstream':{'actions':[
+        action('create', 'd3', None),
+        action('create', 'd4', None),
+        action('create', 'd5', None),
+    ]},
+}
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp()
+        self.path = os.path.join(self.d, 'checkpoint')
+        self.checkpoint = Checkpoint(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_nothing_pending(self):
+        self.assertEqual(self.checkpoint.pending(), None)
+
+    def test_pending_leaves_out_landed_writes(self):
+        started = datetime(2001, 2, 3, 4, 5, 6)
+        self.checkpoint.begin(PLAN, started)
+        self.checkpoint.outcome('downstream', 1, 'deleted')
+        self.checkpoint.outcome('upstream', 0, 'saved', 'g3')
+        self.checkpoint.outcome('upstream', 0, 'linked', 'd3')
+        self.checkpoint.outcome('upstream', 1, 'saved', 'g4')
+        with open(self.path, 'a') as f:
+            f.write('{"direction": "ups')
+
+        (when, report, unlinked) = Checkpoint(self.path).pending()
+        self.assertEqual(when, started)
+        self.assertEqual(report['downstream']['actions'],
+                [action('update', 'u1', 'd1')])
+        self.assertEqual(report['upstream']['actions'],
+                [action('create', 'd5', None)])
+        self.assertEqual(unlinked, [('d4', 'g4')])
+
+    def test_finish(self):
+        self.checkpoint.begin(PLAN)
+        self.checkpoint.finish()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.checkpoint.pending(), None)
@@ -0,0 +1,121 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.daemon import AdaptiveInterval, Daemon, FileWatcher
+from tasksync.task import TaskRepository
+
+import os
+import shutil
+import tempfile
+import unittest
+
+class MockRepository(TaskRepository):
+    def __init__(self, paths):
+        self._paths = paths
+
+    def watched_paths(self):
+        return self._paths
+
+def counts(saved):
+    return {'saved':saved, 'deleted':0, 'skipped':0}
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp()
+        self.path = os.path.join(self.d, 'pending.data')
+        self.write('a')
+
+        self.now = 0.0
+        self.runs = []
+        self.saved = 0
+        self.runbook = {'tw':{
+            'upstream':{'repository':MockRepository([])},
+            'downstream':{'repository':MockRepository([self.path])},
+        }}
+        self.daemon = Daemon(self.runbook, run=self.sync, poll_min=10,
+                poll_max=40, debounce=2, max_delay=5, clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def sync(self, execution):
+        self.runs.append(self.now)
+        return {'upstream':counts(self.saved), 'downstream':counts(0)}
+
+    def write(self, content):
+        with open(self.path, 'a') as f:
+            f.write(content)
+
+    def at(self, now):
+        self.now = now
+        return self.daemon.step()
+
+    def test_syncs_at_start_then_polls_with_backoff(self):
+        for now in range(0, 100):
+            self.at(now)
+        self.assertEqual(self.runs, [0, 20, 60])
+
+    def test_writes_reset_the_interval(self):
+        self.saved = 1
+        self.at(0)
+        self.saved = 0
+        self.at(9)
+        self.at(10)
+        self.at(29)
+        self.at(30)
+        self.assertEqual(self.runs, [0, 10, 30])
+
+    def test_burst_of_changes_makes_one_sync(self):
+        self.at(0)
+        for now in (1, 2, 3):
+            self.write('b')
+            self.at(now)
+        self.at(4)
+        self.assertEqual(self.runs, [0])
+        self.at(5)
+        self.assertEqual(self.runs, [0, 5])
+
+    def test_constant_changes_sync_after_max_delay(self):
+        self.at(0)
+        for now in range(1, 7):
+            self.write('b')
+            self.at(now)
+        self.assertEqual(self.runs, [0, 6])
+
+class TestFileWatcher(unittest.TestCase):
+    def test_missing_file_appearing_is_a_change(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'journal')
+            watcher = FileWatcher([path])
+            self.assertFalse(watcher.changed())
+            open(path, 'w').close()
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+        finally:
+            shutil.rmtree(d)
+
+class TestAdaptiveInterval(unittest.TestCase):
+    def test_backoff_is_bounded(self):
+        interval = AdaptiveInterval(1, 3)
+        interval.backoff()
+        interval.backoff()
+        self.assertEqual(interval.current, 3)
+        interval.reset()
+        self.assertEqual(interval.current, 1)
@@ -0,0 +1,78 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from datetime import datetime, timedelta, timezone
+from tasksync import dates
+
+import os
+import time
+import unittest
+
+class TestDates(unittest.TestCase):
+    def test_taskwarrior_forms_agree(self):
+        expected = datetime(2009, 2, 13, 23, 31, 30)
+        self.assertEqual(dates.parse_taskwarrior('1234567890'), expected)
+        self.assertEqual(dates.parse_taskwarrior('20090213T233130Z'), expected)
+        self.assertEqual(dates.format_taskwarrior(expected), '1234567890')
+        self.assertEqual(dates.format_taskwarrior_iso(expected), '20090213T233130Z')
+        self.assertEqual(dates.format_taskwarrior_iso('1234567890'), '20090213T233130Z')
+        self.assertEqual(dates.format_taskwarrior_iso('20090213T233130Z'), '20090213T233130Z')
+
+    def test_google_round_trip(self):
+        parsed = dates.parse_google('2001-02-03T04:05:06.789Z')
+        self.assertEqual(parsed, datetime(2001, 2, 3, 4, 5, 6, 789000))
+        self.assertEqual(dates.format_google(parsed), '2001-02-03T04:05:06.000Z')
+        # Other precisions take the slow path.
+        self.assertEqual(dates.parse_google('2001-02-03T04:05:06.5Z'),
+                datetime(2001, 2, 3, 4, 5, 6, 500000))
+
+    def test_aware_dates_are_converted(self):
+        aware = datetime(2009, 2, 14, 1, 31, 30, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(dates.format_taskwarrior(aware), '1234567890')
+        self.assertEqual(dates.format_google(aware), '2009-02-13T23:31:30.000Z')
+
+    def test_local_timezone_is_ignored(self):
+        if not hasattr(time, 'tzset'):
+            self.skipTest("The timezone can't be changed.")
+        previous = os.environ.get('TZ')
+        os.environ['TZ'] = 'America/Toronto'
+        time.tzset()
+        try:
+            due = datetime(2001, 2, 3, 12, 30)
+            self.assertEqual(dates.parse_taskwarrior(dates.format_taskwarrior(due)), due)
+            self.assertEqual(dates.format_taskwarrior(due), '981203400')
+        finally:
+            if previous is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = previous
+            time.tzset()
+
+    def test_malformed_dates_are_rejected(self):
+        self.assertRaises(ValueError, dates.parse_taskwarrior, '20091313T000000Z')
+        self.assertRaises(ValueError, dates.parse_taskwarrior, 'tomorrow')
+        self.assertRaises(ValueError, dates.parse_google, '2001-02-30T00:00:00.000Z')
+
+    def test_conversions_are_memoized(self):
+        dates.parse_google.cache_clear()
+        dates.parse_google('2001-02-03T00:00:00.000Z')
+        dates.parse_google('2001-02-03T00:00:00.000Z')
+        info = dates.parse_google.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertEqual(info.maxsize, dates.CACHE_SIZE)
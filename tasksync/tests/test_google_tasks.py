@@ -47,6 +47,25 @@ class TestGoogleTask(unittest.TestCase):
         self.assertEqual(task.status, 'completed')
         self.assertTrue(task.is_completed)
 
+        task._source['deleted'] = True
+        self.assertEqual(task.status, 'deleted')
+        self.assertTrue(task.is_deleted)
+        self.assertFalse(task.should_sync())
+
+
+    def test_fingerprint_follows_changes(self):
+        task = GoogleTask({'status':'needsAction', 'title':'a',
+            'due':'2001-02-03T00:00:00.000Z'}, 'foo')
+        self.assertFalse(hasattr(task, '__dict__'))
+        fingerprint = task.fingerprint
+
+        task.copy_from(GoogleTask({'status':'completed', 'title':'a',
+            'completed':'2001-02-04T00:00:00.000Z'}, 'foo'))
+        self.assertNotEqual(task.fingerprint, fingerprint)
+
+        task._source = {'status':'needsAction', 'title':'a',
+            'due':'2001-02-03T00:00:00.000Z'}
+        self.assertEqual(task.fingerprint, fingerprint)
 
 class TestGoogleTaskFactory(unittest.TestCase):
     def setUp(self):
@@ -60,6 +79,13 @@ class TestGoogleTaskFactory(unittest.TestCase):
         self.assertEqual(task.subject, 'Stuff')
         self.assertEqual(task.etag, '1e')
 
+    def test_create_from_map_without_copy(self):
+        source = dict(TASK_1)
+        task = self.factory.create_from('test', map=source, copy=False)
+        self.assertTrue(task._source is source)
+        self.assertFalse(self.factory.create_from('test', map=source)._source
+                is source)
+
     def test_create_from_other(self):
         task = self.factory.create_from('test', map=TASK_1)
         task = self.factory.create_from('test', other=task)
@@ -108,10 +134,8 @@ class TestGoogleTaskRepository(unittest.TestCase):
         task_2 = {"status":"completed", "title":"More stuff", "id":"2",
                 "etag":"2", "kind":"tasks#task"}
 
-        tasks_1 = {"kind":"tasks#tasks", "etag":"1",
-                "nextPageToken":"1", "items":[task_1]}
-        tasks_2 = {"kind":"tasks#tasks", "etag":"2",
-                "nextPageToken":"2", "items":[task_2]}
+        tasks_1 = {"kind":"tasks#tasks", "etag":"1", "items":[task_1]}
+        tasks_2 = {"kind":"tasks#tasks", "etag":"2", "items":[task_2]}
         tasklist_1_tasks = mock()
         tasklist_2_tasks = mock()
         when(self.client).tasks(any()).thenReturn(tasklist_1_tasks)\
@@ -128,8 +152,41 @@ class TestGoogleTaskRepository(unittest.TestCase):
     def test_open_should_load_list_names(self):
         self.assertEqual(len(self.repository._task_lists), 2)
 
+    def test_init_is_lazy(self):
+        client = mock()
+        repository = GoogleTaskRepository(self.factory, flags=None,
+                client=client, task_list_filter=lambda t: True)
+        verifyZeroInteractions(client)
+
     def test_all_returns_all_lists(self):
-        self.assertEqual(len(self.repository.all()), 2)
+        self.assertEqual(len(list(self.repository.all())), 2)
+
+    def test_all_concurrently(self):
+        self.repository._concurrency = 2
+        tasks = sorted(t.uid for t in self.repository.all())
+        self.assertEqual(tasks, ['1', '2'])
+
+    def test_all_concurrently_stops_early(self):
+        self.repository._concurrency = 2
+        tasks = self.repository.all()
+        next(tasks)
+        tasks.close()
+
+    def test_all_follows_page_tokens(self):
+        page_1 = {"kind":"tasks#tasks", "nextPageToken":"p2",
+                "items":[{"status":"needsAction", "title":"a", "id":"a"}]}
+        page_2 = {"kind":"tasks#tasks",
+                "items":[{"status":"needsAction", "title":"b", "id":"b"}]}
+        pages = mock()
+        when(self.client).tasks(any()).thenReturn(pages)
+        when(self.client).execute(pages).thenReturn(page_1).thenReturn(page_2)
+        self.repository._task_lists = {'home':'1'}
+
+        tasks = self.repository.all()
+        self.assertEqual(next(tasks).uid, 'a')
+        verify(self.client, 1).execute(pages)
+        self.assertEqual([t.uid for t in tasks], ['b'])
+        verify(self.client, 2).execute(pages)
 
     def test_save_updates_known_to_batch(self):
         task = self.factory.create_from('home', map={'status':'needsAction'})
@@ -146,6 +203,31 @@ class TestGoogleTaskRepository(unittest.TestCase):
         self.repository.batch_close(batch)
         verify(self.client, 2).execute(any())
 
+    def test_full_batches_are_flushed(self):
+        when(self.client).new_batch().thenReturn(MockBatch())
+        self.repository._batch_size = 2
+        batch = {'count':0, 'batch':MockBatch(), 'flushing':[]}
+        for _ in range(0, 5):
+            task = self.factory.create_from('home', map={'status':'needsAction'})
+            self.repository.save(task, batch, None, None)
+        # Two full batches were sent (after loading lists), one is left.
+        verify(self.client, 3).execute(any())
+        self.assertEqual(batch['count'], 1)
+        self.repository.batch_close(batch)
+        verify(self.client, 4).execute(any())
+
+    def test_full_batches_are_pipelined(self):
+        when(self.client).new_batch().thenReturn(MockBatch())
+        repository = GoogleTaskRepository(self.factory,
+                flags=None, client=self.client, task_list_filter=lambda t: True,
+                batch_size=1, pipeline=2)
+        batch = repository.batch_open()
+        task = self.factory.create_from('home', map={'status':'needsAction'})
+        repository.save(task, batch, None, None)
+        self.assertEqual(len(batch['flushing']), 1)
+        repository.batch_close(batch)
+        self.assertTrue(batch['flushing'][0].done())
+
     def test_execute_batch_with_no_adds(self):
         batch = {'count':0, 'batch':MockBatch()}
         self.repository.batch_close(batch)
@@ -0,0 +1,279 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from datetime import datetime, timedelta
+from googleapiclient.errors import HttpError
+from tasksync.google_tasks import ApiClient, GoogleTaskFactory, GoogleTaskRepository
+from tasksync.quota import Quota
+from tasksync.tests.google_tasks_server import GoogleTasksServer
+
+import asyncio
+import json
+import unittest
+
+class TestGoogleTaskRepositoryAgainstServer(unittest.TestCase):
+    def setUp(self):
+        self.server = GoogleTasksServer().start()
+        self.work = self.server.add_list('Work')
+        self.home = self.server.add_list('Home')
+        self.factory = GoogleTaskFactory()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def repository(self, **kwargs):
+        return GoogleTaskRepository(self.factory, None,
+                api_root=self.server.root_url,
+                task_list_filter=lambda t: True, **kwargs)
+
+    def test_client_is_built_on_first_use(self):
+        repository = self.repository()
+        self.assertEqual(self.server.stats['requests'], 0)
+        self.assertEqual(list(repository.all()), [])
+        # No discovery request: the shipped document is used.
+        self.assertEqual(self.server.stats['requests'], 3)
+
+    def test_all_follows_pages(self):
+        for i in range(0, 250):
+            self.server.add_task(self.work, title='Task %d' % i)
+        self.server.add_task(self.home, title='Home')
+
+        for concurrency in (1, 2):
+            tasks = list(self.repository(concurrency=concurrency).all())
+            self.assertEqual(len(tasks), 251)
+            self.assertEqual(len([t for t in tasks if t.list_name == 'Work']), 250)
+
+    def test_save_in_batches(self):
+        repository = self.repository(batch_size=10)
+        saved = []
+        batch = repository.batch_open()
+        for i in range(0, 25):
+            task = self.factory.create_from('Work', map={'title':'Task %d' % i})
+            repository.save(task, batch, lambda t, u: saved.append(t), None)
+        repository.batch_close(batch)
+
+        self.assertEqual(len(saved), 25)
+        self.assertTrue(all(t.uid is not None and t.etag is not None for t in saved))
+        self.assertEqual(len(self.server.tasks(self.work)), 25)
+        self.assertEqual(self.server.stats['batches'], 3)
+
+    def test_calls_count_against_quota(self):
+        quota = Quota()
+        repository = self.repository(batch_size=10, quota=quota)
+        batch = repository.batch_open()
+        for i in range(0, 15):
+            task = self.factory.create_from('Work', map={'title':'Task %d' % i})
+            repository.save(task, batch, None, None)
+        repository.batch_close(batch)
+
+        # Loading the lists, then each request of both batches.
+        self.assertEqual(quota.used(), 16)
+        self.assertEqual(self.server.stats['operations'], 16)
+
+    def test_update_and_delete(self):
+        kept = self.server.add_task(self.work, title='Kept')
+        gone = self.server.add_task(self.work, title='Gone')
+        repository = self.repository()
+        tasks = {t.subject:t for t in repository.all()}
+
+        batch = repository.batch_open()
+        tasks['Kept']._source['title'] = 'Renamed'
+        repository.save(tasks['Kept'], batch, None, None)
+        repository.delete(tasks['Gone'], batch, None, None)
+        repository.batch_close(batch)
+
+        self.assertEqual(self.server.lists[self.work]['tasks'][kept['id']]['title'],
+                'Renamed')
+        self.assertTrue(self.server.lists[self.work]['tasks'][gone['id']]['deleted'])
+        self.assertEqual([t.subject for t in repository.all()], ['Renamed'])
+
+    def test_unread_fields_survive_updates(self):
+        kept = self.server.add_task(self.work, title='Kept', notes='Notes',
+                due='2001-02-03T00:00:00.000Z')
+        repository = self.repository()
+        task = list(repository.all())[0]
+        # Only the fields a sync reads are downloaded.
+        self.assertFalse('notes' in task._source)
+        self.assertFalse('selfLink' in task._source)
+
+        batch = repository.batch_open()
+        task._source['title'] = 'Renamed'
+        del task._source['due']
+        repository.save(task, batch, None, None)
+        repository.batch_close(batch)
+
+        stored = self.server.lists[self.work]['tasks'][kept['id']]
+        self.assertEqual(stored['title'], 'Renamed')
+        self.assertEqual(stored['notes'], 'Notes')
+        self.assertFalse('due' in stored)
+        self.assertFalse('notes' in task._source)
+
+    def test_transfer_is_compressed_and_counted(self):
+        for i in range(0, 100):
+            self.server.add_task(self.work, title='Task %d' % i, notes='x' * 1000)
+        repository = self.repository()
+        self.assertEqual(len(list(repository.all())), 100)
+
+        transfer = repository._client.transfer
+        full = len(json.dumps(self.server.tasks(self.work)))
+        self.assertTrue(0 < transfer.received < full / 10)
+        self.assertTrue(transfer.sent > 0)
+        repository.synced()
+        self.assertEqual((transfer.sent, transfer.received), (0, 0))
+
+    def test_get_and_modified_since(self):
+        task = self.server.add_task(self.home, title='Home')
+        repository = self.repository()
+
+        self.assertEqual([t.uid for t in repository.get([task['id']])], [task['id']])
+        since = datetime.utcnow() - timedelta(minutes=1)
+        self.assertEqual(len(list(repository.modified_since(since))), 1)
+        since = datetime.utcnow() + timedelta(minutes=1)
+        self.assertEqual(len(list(repository.modified_since(since))), 0)
+
+    def test_injected_errors(self):
+        self.server.rate_limit = 1.0
+        client = ApiClient(None, api_root=self.server.root_url, max_retries=0)
+        with self.assertRaises(HttpError) as raised:
+            client.execute(client.tasklists(lambda s: s.list()))
+        self.assertEqual(raised.exception.resp.status, 429)
+        self.assertEqual(raised.exception.resp['retry-after'], '1')
+
+    def test_throttled_writes_are_retried(self):
+        repository = self.repository(batch_size=10)
+        repository._task_lists = {'Work':self.work}
+        clock = [0.0]
+        def sleep(seconds):
+            clock[0] += seconds
+        repository._clock = lambda: clock[0]
+        repository._sleep = sleep
+        self.server.retry_after = 0
+        self.server.rate_limit = 0.3
+        self.server.error_rate = 0.1
+        self.server._random.seed(1)
+
+        saved = []
+        batch = repository.batch_open()
+        for i in range(0, 40):
+            task = self.factory.create_from('Work', map={'title':'Task %d' % i})
+            repository.save(task, batch, lambda t, u: saved.append(t), None)
+        repository.batch_close(batch)
+
+        self.assertEqual(len(saved), 40)
+        self.assertEqual(len(self.server.tasks(self.work)), 40)
+        self.assertTrue(self.server.stats['throttled'] > 0)
+        self.assertTrue(clock[0] > 0)
+
+class TestGoogleTaskRepositoryAsyncAgainstServer(unittest.TestCase):
+    def setUp(self):
+        self.server = GoogleTasksServer().start()
+        self.work = self.server.add_list('Work')
+        self.home = self.server.add_list('Home')
+        self.factory = GoogleTaskFactory()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def repository(self, **kwargs):
+        return GoogleTaskRepository(self.factory, None,
+                api_root=self.server.root_url,
+                task_list_filter=lambda t: True, **kwargs)
+
+    def test_all_matches_the_blocking_client(self):
+        for i in range(0, 250):
+            self.server.add_task(self.work, title='Task %d' % i)
+        self.server.add_task(self.home, title='Home')
+
+        repository = self.repository(concurrency=2)
+        tasks = asyncio.run(repository.all_async())
+        self.assertEqual(sorted(t.uid for t in tasks),
+                sorted(t.uid for t in self.repository().all()))
+        # Both lists share the two kept-alive connections.
+        self.assertEqual(repository._async_client.stats['requests'], 5)
+        self.assertEqual(repository._async_client.stats['connections'], 2)
+
+    def test_save_in_batches(self):
+        repository = self.repository(batch_size=10, pipeline=2)
+        repository._task_lists = {'Work':self.work}
+        saved = []
+
+        async def save():
+            batch = repository.batch_open_async()
+            for i in range(0, 25):
+                task = self.factory.create_from('Work', map={'title':'Task %d' % i})
+                repository.save(task, batch, lambda t, u: saved.append(t), None)
+            # The full batches are already on their way.
+            self.assertEqual(len(batch['sending']), 2)
+            await repository.batch_close_async(batch)
+        asyncio.run(save())
+
+        self.assertEqual(len(saved), 25)
+        self.assertTrue(all(t.uid is not None and t.etag is not None for t in saved))
+        self.assertEqual(len(self.server.tasks(self.work)), 25)
+        self.assertEqual(self.server.stats['batches'], 3)
+
+    def test_update_and_delete(self):
+        kept = self.server.add_task(self.work, title='Kept')
+        gone = self.server.add_task(self.work, title='Gone')
+        repository = self.repository()
+        tasks = {t.subject:t for t in asyncio.run(repository.all_async())}
+        self.assertTrue(repository._client.transfer.received > 0)
+
+        batch = repository.batch_open_async()
+        tasks['Kept']._source['title'] = 'Renamed'
+        repository.save(tasks['Kept'], batch, None, None)
+        repository.delete(tasks['Gone'], batch, None, None)
+        asyncio.run(repository.batch_close_async(batch))
+
+        self.assertEqual(self.server.lists[self.work]['tasks'][kept['id']]['title'],
+                'Renamed')
+        self.assertTrue(self.server.lists[self.work]['tasks'][gone['id']]['deleted'])
+
+    def test_throttled_writes_are_retried(self):
+        repository = self.repository(batch_size=10)
+        repository._task_lists = {'Work':self.work}
+        clock = [0.0]
+        async def sleep(seconds):
+            clock[0] += seconds
+        repository._clock = lambda: clock[0]
+        repository._async_sleep = sleep
+        repository._async_client._sleep = sleep
+        self.server.retry_after = 0
+        self.server.rate_limit = 0.3
+        self.server.error_rate = 0.1
+        self.server._random.seed(1)
+
+        saved = []
+        batch = repository.batch_open_async()
+        for i in range(0, 40):
+            task = self.factory.create_from('Work', map={'title':'Task %d' % i})
+            repository.save(task, batch, lambda t, u: saved.append(t), None)
+        asyncio.run(repository.batch_close_async(batch))
+
+        self.assertEqual(len(saved), 40)
+        self.assertEqual(len(self.server.tasks(self.work)), 40)
+        self.assertTrue(self.server.stats['throttled'] > 0)
+        self.assertTrue(clock[0] > 0)
+
+    def test_injected_errors(self):
+        self.server.rate_limit = 1.0
+        repository = self.repository(max_retries=0)
+        with self.assertRaises(HttpError) as raised:
+            asyncio.run(repository.all_async())
+        self.assertEqual(raised.exception.resp.status, 429)
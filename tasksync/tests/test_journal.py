@@ -0,0 +1,76 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.journal import Journal, JOURNAL_NAME, hook
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.d, JOURNAL_NAME))
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_read_missing(self):
+        self.assertFalse(self.journal.exists())
+        self.assertEqual(self.journal.read(), ({}, 0))
+
+    def test_read_keeps_latest(self):
+        self.journal.append({'uuid':'a', 'description':'old'})
+        self.journal.append({'uuid':'b', 'description':'b'})
+        self.journal.append({'uuid':'a', 'description':'new'})
+        tasks, offset = self.journal.read()
+        self.assertEqual(tasks['a']['description'], 'new')
+        self.assertEqual(len(tasks), 2)
+        self.assertEqual(offset, os.path.getsize(self.journal.path))
+
+    def test_read_skips_partial_line(self):
+        self.journal.append({'uuid':'a'})
+        with open(self.journal.path, 'a') as f:
+            f.write('{"uuid":')
+        tasks, offset = self.journal.read()
+        self.assertEqual(list(tasks.keys()), ['a'])
+
+        self.journal.compact(offset)
+        with open(self.journal.path) as f:
+            self.assertEqual(f.read(), '{"uuid":')
+
+    def test_hook_on_modify(self):
+        original = json.dumps({'uuid':'a', 'description':'old'})
+        modified = json.dumps({'uuid':'a', 'description':'new'})
+        stdout = io.StringIO()
+        hook('on-modify', ['api:2', 'data:%s' % self.d],
+                io.StringIO(original + '\n' + modified + '\n'), stdout)
+        self.assertEqual(stdout.getvalue(), modified + '\n')
+        self.assertEqual(self.journal.read()[0]['a']['description'], 'new')
+
+    def test_hook_never_fails_the_change(self):
+        added = json.dumps({'uuid':'a'})
+        stdout = io.StringIO()
+        code = hook('on-add', ['data:%s' % os.path.join(self.d, 'missing')],
+                io.StringIO(added + '\n'), stdout)
+        self.assertEqual(code, 0)
+        self.assertTrue(stdout.getvalue().startswith(added + '\n'))
@@ -0,0 +1,126 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from .mocks import MockUpstreamTask, MockDownstreamTask
+
+from mockito import mock, when, verify, any
+from tasksync.plan import describe, dump, format_report, load, restore
+from tasksync.quota import Quota
+from tasksync.task import TaskFactory, TaskRepository
+from tasksync.sync import plan_sync
+
+import io
+import unittest
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.upstream_repo = mock(TaskRepository, strict=False)
+        self.downstream_repo = mock(TaskRepository, strict=False)
+        self.upstream_repo.quota = None
+        self.downstream_repo.quota = None
+        when(self.upstream_repo).estimate(any(), any()).thenAnswer(
+                lambda s, d: {'api_calls':s + d, 'subprocesses':0,
+                    'batches':1 if s + d else 0})
+        when(self.downstream_repo).estimate(any(), any()).thenAnswer(
+                lambda s, d: {'api_calls':0, 'subprocesses':s + d,
+                    'batches':1 if s + d else 0})
+
+        self.execution = {
+            'upstream':{
+                'repository':self.upstream_repo,
+                'factory':mock(TaskFactory, strict=False),
+                'delete_orphans':True,
+                'filter':None,
+                'cb':None,
+            },
+            'downstream':{
+                'repository':self.downstream_repo,
+                'factory':mock(TaskFactory, strict=False),
+                'delete_orphans':False,
+                'filter':None,
+                'cb':None,
+            }
+        }
+
+        self.new_upstream = MockUpstreamTask(subject='a', provider='g', uid='u1')
+        self.new_downstream = MockDownstreamTask()
+        self.new_downstream._uid = 'd1'
+        self.orphan = MockDownstreamTask()
+        self.orphan._uid = 'd2'
+        self.orphan.associate_with(
+                MockUpstreamTask(subject='b', provider='g', uid='gone'))
+        when(self.downstream_repo).all().thenReturn(
+                [self.new_downstream, self.orphan])
+        when(self.upstream_repo).all().thenReturn([self.new_upstream])
+
+    def test_describe_quota(self):
+        self.assertEqual(describe(self.execution,
+            *plan_sync(self.execution))['quota'], None)
+
+        self.upstream_repo.quota = Quota(per_day=1)
+        self.upstream_repo.quota.acquire(1)
+        report = describe(self.execution, *plan_sync(self.execution))
+        self.assertEqual(report['quota'],
+                {'api_calls':1, 'used':1, 'remaining':0})
+        self.assertTrue("can't cover" in format_report('test', report))
+
+    def test_describe_counts_and_costs(self):
+        report = describe(self.execution, *plan_sync(self.execution))
+
+        self.assertEqual(report['downstream']['counts']['create'], 1)
+        self.assertEqual(report['downstream']['counts']['orphan'], 1)
+        self.assertEqual(report['downstream']['cost']['subprocesses'], 1)
+        self.assertEqual(report['upstream']['counts']['create'], 1)
+        # The create, then the association written back downstream.
+        self.assertEqual(report['upstream']['cost']['api_calls'], 1)
+        self.assertEqual(report['upstream']['cost']['subprocesses'], 1)
+        self.assertEqual(report['upstream']['cost']['batches'], 2)
+        self.assertTrue('1 create' in format_report('x', report))
+
+    def test_round_trip(self):
+        report = describe(self.execution, *plan_sync(self.execution))
+        f = io.StringIO()
+        dump({'x':report}, f)
+        f.seek(0)
+        report = load(f)['x']
+
+        when(self.upstream_repo).get(set(['u1'])).thenReturn([self.new_upstream])
+        when(self.downstream_repo).get(set(['d1'])).thenReturn(
+                [self.new_downstream])
+        when(self.downstream_repo).get(set(['d2'])).thenReturn([self.orphan])
+        upstream_q, downstream_q = restore(self.execution, report)
+
+        self.assertEqual(upstream_q, [(self.new_downstream, None)])
+        self.assertEqual(sorted(downstream_q, key=lambda q: q[0] is None),
+                [(self.new_upstream, None), (None, self.orphan)])
+
+    def test_restore_skips_missing(self):
+        report = describe(self.execution, *plan_sync(self.execution))
+        when(self.upstream_repo).get(any()).thenReturn([])
+        when(self.downstream_repo).get(any()).thenReturn([])
+
+        upstream_q, downstream_q = restore(self.execution, report)
+
+        self.assertEqual(upstream_q, [])
+        self.assertEqual(downstream_q, [])
+
+    def test_load_rejects_unknown_version(self):
+        with self.assertRaises(ValueError):
+            load(io.StringIO('{"version": 0}'))
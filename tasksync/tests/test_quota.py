@@ -0,0 +1,66 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.quota import Quota, QuotaExceeded
+
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestQuota(unittest.TestCase):
+    def setUp(self):
+        self.now = 86400.0 * 10
+        self.slept = []
+        def sleep(seconds):
+            self.slept.append(seconds)
+            self.now += seconds
+        self.sleep = sleep
+
+    def quota(self, **kwargs):
+        return Quota(clock=lambda: self.now, sleep=self.sleep, **kwargs)
+
+    def test_burst_then_spaced(self):
+        quota = self.quota(per_second=2)
+        for _ in range(0, 4):
+            quota.acquire()
+        self.assertEqual(self.slept, [0.5, 0.5])
+
+    def test_large_batch_waits_for_its_calls(self):
+        quota = self.quota(per_second=10)
+        quota.acquire(50)
+        self.assertEqual(self.slept, [4.0])
+
+    def test_daily_limit(self):
+        quota = self.quota(per_day=3)
+        quota.acquire(2)
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire(2)
+        self.assertEqual(quota.remaining(), 1)
+        self.now += 86400
+        self.assertEqual(quota.remaining(), 3)
+
+    def test_usage_is_persisted(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'quota.db')
+            self.quota(per_day=10, path=path).acquire(4)
+            self.assertEqual(self.quota(per_day=10, path=path).used(), 4)
+        finally:
+            shutil.rmtree(d)
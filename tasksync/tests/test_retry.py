@@ -0,0 +1,63 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from googleapiclient.errors import HttpError
+from tasksync.retry import AdaptiveLimit, backoff, is_retriable, is_throttled, retry_after
+
+import httplib2
+import json
+import unittest
+
+def error(status, reason=None, headers=None):
+    resp = httplib2.Response(dict(headers or {}, status=status))
+    content = json.dumps({'error':{'errors':[{'reason':reason}]}})
+    return HttpError(resp, content.encode('utf-8'))
+
+class TestRetry(unittest.TestCase):
+    def test_throttling(self):
+        self.assertTrue(is_throttled(error(429)))
+        self.assertTrue(is_throttled(error(403, 'rateLimitExceeded')))
+        self.assertFalse(is_throttled(error(403, 'forbidden')))
+        self.assertFalse(is_throttled(ValueError()))
+
+    def test_retriable(self):
+        self.assertTrue(is_retriable(error(503)))
+        self.assertTrue(is_retriable(error(403, 'userRateLimitExceeded')))
+        self.assertFalse(is_retriable(error(404)))
+        self.assertFalse(is_retriable(error(400)))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(error(429, headers={'retry-after':'7'})), 7)
+        self.assertEqual(retry_after(error(429)), None)
+
+    def test_backoff_is_bounded_and_honours_wait(self):
+        for attempt in range(0, 10):
+            self.assertTrue(0 <= backoff(attempt, cap=8) <= 8)
+        self.assertTrue(backoff(0, wait=30) >= 30)
+
+    def test_adaptive_limit(self):
+        limit = AdaptiveLimit(10, minimum=2)
+        limit.throttled()
+        self.assertEqual(limit.value, 5)
+        limit.throttled()
+        limit.throttled()
+        self.assertEqual(limit.value, 2)
+        for _ in range(0, 20):
+            limit.succeeded()
+        self.assertEqual(limit.value, 10)
@@ -0,0 +1,85 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.scheduler import group, run_all
+from tasksync.task import TaskRepository
+
+import threading
+import time
+import unittest
+
+class MockRepository(TaskRepository):
+    def __init__(self, resource=None):
+        self._resource = resource
+
+    @property
+    def resource(self):
+        return self._resource or self
+
+def execution(upstream, downstream):
+    return {'upstream':{'repository':upstream},
+            'downstream':{'repository':downstream}}
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.runbook = {
+            'a':execution(MockRepository(), MockRepository('tw1')),
+            'b':execution(MockRepository(), MockRepository('tw2')),
+            'c':execution(MockRepository(), MockRepository('tw1')),
+        }
+
+    def test_group_by_shared_resource(self):
+        self.assertEqual(sorted(group(self.runbook)), [['a', 'c'], ['b']])
+
+    def test_group_merges_transitively(self):
+        shared = MockRepository()
+        self.runbook['d'] = execution(shared, MockRepository('tw2'))
+        self.runbook['e'] = execution(shared, MockRepository('tw1'))
+        self.assertEqual(group(self.runbook), [['a', 'b', 'c', 'd', 'e']])
+
+    def test_shared_resources_never_overlap(self):
+        running = set()
+        overlapped = []
+        lock = threading.Lock()
+        def run(execution):
+            resource = execution['downstream']['repository'].resource
+            with lock:
+                if resource in running:
+                    overlapped.append(resource)
+                running.add(resource)
+            time.sleep(0.01)
+            with lock:
+                running.discard(resource)
+            return resource
+
+        results = run_all(self.runbook, jobs=3, run=run)
+        self.assertEqual(overlapped, [])
+        self.assertEqual(results['b']['summary'], 'tw2')
+
+    def test_failure_doesnt_stop_others(self):
+        def run(execution):
+            if execution is self.runbook['a']:
+                raise ValueError("Boom.")
+            return 'done'
+
+        results = run_all(self.runbook, jobs=2, run=run)
+        self.assertEqual(results['a']['status'], 'failed')
+        self.assertTrue(isinstance(results['a']['error'], ValueError))
+        self.assertEqual(results['b']['status'], 'ok')
+        self.assertEqual(results['c']['summary'], 'done')
@@ -0,0 +1,73 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from .mocks import MockUpstreamTask, MockDownstreamTask
+
+from datetime import datetime
+from tasksync.state import SyncState, SKEW
+
+import unittest
+
+
+class TestSyncState(unittest.TestCase):
+    def setUp(self):
+        self.state = SyncState(':memory:')
+        self.upstream = MockUpstreamTask(provider='g', uid='u', etag='e')
+        self.downstream = MockDownstreamTask()
+        self.downstream._uid = 'd'
+        self.downstream.associate_with(self.upstream)
+
+    def test_never_synced(self):
+        self.assertEqual(self.state.last_synced(), None)
+
+    def test_commit_records_time(self):
+        started = datetime(2001, 2, 3, 4, 5, 6)
+        self.state.commit(started)
+        self.assertEqual(self.state.last_synced(), started - SKEW)
+
+    def test_record_requires_commit(self):
+        self.state.record(self.downstream, self.upstream)
+        self.assertEqual(self.state.downstream_uid('g', 'u'), None)
+        self.state.commit(datetime.utcnow())
+        self.assertEqual(self.state.downstream_uid('g', 'u'), 'd')
+
+    def test_begin_discards_uncommitted(self):
+        self.state.record(self.downstream, self.upstream)
+        self.state.begin()
+        self.state.commit(datetime.utcnow())
+        self.assertEqual(self.state.downstream_uid('g', 'u'), None)
+
+    def test_forget(self):
+        self.state.record(self.downstream, self.upstream)
+        self.state.commit(datetime.utcnow())
+        self.state.forget(self.upstream)
+        self.state.commit(datetime.utcnow())
+        self.assertEqual(self.state.downstream_uid('g', 'u'), None)
+
+    def test_is_echo(self):
+        self.downstream._etag = 'e'
+        self.state.record(self.downstream, self.upstream)
+        self.state.commit(datetime.utcnow())
+        self.assertTrue(self.state.is_echo(self.downstream))
+
+        self.downstream.mark_dirty()
+        self.assertFalse(self.state.is_echo(self.downstream))
+
+    def test_unassociated_is_not_echo(self):
+        self.assertFalse(self.state.is_echo(MockDownstreamTask()))
@@ -20,9 +20,16 @@
 from .mocks import MockUpstreamTask, MockDownstreamTask
 
 from mockito import mock, when, verify, verifyZeroInteractions, any
+from tasksync.checkpoint import Checkpoint
 from tasksync.task import TaskFactory, TaskRepository
-from tasksync.sync import sync_all
-
+from tasksync.state import SyncState
+from tasksync.sync import plan_sync, sync_all
+
+import datetime
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
 
@@ -134,6 +141,23 @@ class TestSync(unittest.TestCase):
         verify(self.downstream_repo).save(d, any(), any(), any())
         verify(self.upstream_repo, 0).save(any(), any(), any(), any())
 
+    def test_known_among_unassociated(self):
+        u = MockUpstreamTask(subject='a', provider='g', uid='x')
+        d = MockDownstreamTask()
+        d.associate_with(u)
+        d.mark_dirty()
+        others = [MockDownstreamTask(subject=str(i)) for i in range(0, 3)]
+        when(self.downstream_repo).all().thenReturn([d] + others)
+        when(self.upstream_repo).all().thenReturn([u])
+        when(self.upstream_factory).create_from(other=any()).thenReturn(
+                self.upstream[0])
+
+        self._do_sync_all()
+
+        verify(self.downstream_repo).save(d, any(), any(), any())
+        verify(self.downstream_repo, 0).delete(any(), any(), any(), any())
+        verify(self.upstream_repo).save(self.upstream[0], any(), any(), any())
+
     def test_unknown_from_upstream(self):
         d = self.downstream[0]
         u = self.upstream[0]
@@ -183,3 +207,174 @@ class TestSync(unittest.TestCase):
         verify(self.downstream_repo, 0).delete(d)
         verify(self.upstream_repo, 0).save(
                 any(), batch=any(), userdata=any(), cb=any())
+
+    def test_incremental_loads_changes_and_counterparts(self):
+        u = self.upstream[0]
+        d = self.downstream[0]
+        d._uid = 'd'
+        d.associate_with(u)
+        state = SyncState(':memory:')
+        state.record(d, u)
+        state.commit(datetime.datetime.utcnow())
+        self.execution['state'] = state
+
+        d.mark_dirty()
+        when(self.upstream_repo).modified_since(any()).thenReturn([u])
+        when(self.downstream_repo).modified_since(any()).thenReturn([])
+        when(self.downstream_repo).get(any()).thenReturn([d])
+
+        self._do_sync_all()
+
+        verify(self.downstream_repo, 0).all()
+        verify(self.upstream_repo, 0).all()
+        verify(self.downstream_repo).get(set(['d']))
+        verify(self.downstream_repo).save(d, any(), any(), any())
+
+    def test_incremental_without_changes(self):
+        state = SyncState(':memory:')
+        state.commit(datetime.datetime.utcnow())
+        self.execution['state'] = state
+
+        when(self.upstream_repo).modified_since(any()).thenReturn([])
+        when(self.downstream_repo).modified_since(any()).thenReturn([])
+
+        self._do_sync_all()
+
+        verify(self.downstream_repo, 0).get(any())
+        verify(self.upstream_repo, 0).get(any())
+        verify(self.downstream_repo, 0).save(any(), any(), any(), any())
+        verify(self.upstream_repo, 0).save(any(), any(), any(), any())
+
+    def test_repositories_are_told_of_completed_sync(self):
+        when(self.upstream_repo).all().thenReturn([])
+        when(self.downstream_repo).all().thenReturn([])
+        self._do_sync_all()
+        verify(self.downstream_repo).synced()
+        verify(self.upstream_repo).synced()
+
+    def test_interrupted_sync_is_resumed(self):
+        d = tempfile.mkdtemp()
+        try:
+            checkpoint = Checkpoint(os.path.join(d, 'checkpoint'))
+            checkpoint.begin({
+                'downstream':{'actions':[]},
+                'upstream':{'actions':[
+                    {'action':'create', 'source':'d1', 'dest':None},
+                    {'action':'create', 'source':'d2', 'dest':None},
+                ]},
+            })
+            # The first create landed, but the sync stopped before the new
+            # association was written back.
+            checkpoint.outcome('upstream', 0, 'saved', 'u1')
+            self.execution['checkpoint'] = Checkpoint(checkpoint._path)
+
+            d1 = self.downstream[0]
+            d1._uid = 'd1'
+            d2 = self.downstream[1]
+            d2._uid = 'd2'
+            u1 = MockUpstreamTask(subject='b', provider='g', uid='u1')
+            when(self.downstream_repo).get(set(['d1'])).thenReturn([d1])
+            when(self.downstream_repo).get(set(['d2'])).thenReturn([d2])
+            when(self.upstream_repo).get(set(['u1'])).thenReturn([u1])
+            when(self.upstream_factory).create_from(other=any()).thenReturn(
+                    MockUpstreamTask())
+            self.upstream_repo.quota = None
+            self.downstream_repo.quota = None
+            when(self.upstream_repo).estimate(any(), any()).thenReturn(
+                    {'api_calls':1, 'subprocesses':0, 'batches':1})
+            when(self.downstream_repo).estimate(any(), any()).thenReturn(
+                    {'api_calls':0, 'subprocesses':1, 'batches':1})
+
+            self._do_sync_all()
+
+            verify(self.downstream_repo, 0).all()
+            verify(self.upstream_repo, 0).all()
+            verify(self.downstream_repo).save(d1, any(), any(), u1)
+            verify(self.upstream_repo, 1).save(any(), any(), any(), any())
+            self.assertEqual(self.execution['checkpoint'].pending(), None)
+        finally:
+            shutil.rmtree(d)
+
+    def test_first_sync_with_state_is_full(self):
+        state = SyncState(':memory:')
+        self.execution['state'] = state
+        when(self.downstream_repo).all().thenReturn([])
+        when(self.upstream_repo).all().thenReturn([])
+
+        self._do_sync_all()
+
+        verify(self.downstream_repo).all()
+        self.assertNotEqual(state.last_synced(), None)
+
+    def test_unchanged_upstream_is_not_written(self):
+        u = MockUpstreamTask(subject='a', provider='g', uid='a', etag='2')
+        d = MockDownstreamTask()
+        d._uid = 'd'
+        d._subject = 'a'
+        d.associate_with(u)
+        # Only the etag differs, and downstream isn't stale: downstream wins.
+        d._etag = '1'
+        d.stale = lambda other: False
+        when(self.downstream_repo).all().thenReturn([d])
+        when(self.upstream_repo).all().thenReturn([u])
+
+        summary = sync_all(self.execution)
+
+        verify(self.upstream_repo, 0).save(any(), any(), any(), any())
+        self.assertEqual(summary['upstream']['skipped'], 1)
+
+    def test_unchanged_downstream_updates_etag_only(self):
+        u = MockUpstreamTask(subject='a', provider='g', uid='a', etag='2')
+        d = MockDownstreamTask()
+        d._uid = 'd'
+        d._subject = 'a'
+        d.associate_with(u)
+        d._etag = '1'
+        when(self.downstream_repo).all().thenReturn([d])
+        when(self.upstream_repo).all().thenReturn([u])
+
+        summary = sync_all(self.execution)
+
+        verify(self.downstream_repo).save(d, any(), any(), u)
+        self.assertEqual(summary['downstream']['skipped'], 1)
+        self.assertEqual(summary['downstream']['saved'], 0)
+
+    def test_both_sides_load_at_once(self):
+        upstream_loading = threading.Event()
+        def upstream():
+            upstream_loading.set()
+            yield MockUpstreamTask(subject='a', provider='g', uid='a')
+        def downstream():
+            # Only returns if the upstream tasks are loading meanwhile.
+            self.assertTrue(upstream_loading.wait(5))
+            return []
+        when(self.upstream_repo).all().thenAnswer(upstream)
+        when(self.downstream_repo).all().thenAnswer(downstream)
+        when(self.downstream_factory).create_from(other=any()).thenReturn(
+                MockDownstreamTask())
+
+        summary = sync_all(self.execution)
+
+        self.assertEqual(summary['downstream']['saved'], 1)
+
+    def test_streamed_upstream_keeps_its_order(self):
+        upstream = [MockUpstreamTask(subject='u%d' % i, provider='g', uid=str(i))
+                for i in range(0, 250)]
+        when(self.upstream_repo).all().thenReturn(iter(upstream))
+        when(self.downstream_repo).all().thenReturn(iter([]))
+
+        upstream_q, downstream_q = plan_sync(self.execution)
+
+        self.assertEqual(upstream_q, [])
+        self.assertEqual([u for (u, _) in downstream_q], upstream)
+
+    def test_upstream_load_failure_is_raised(self):
+        def upstream():
+            yield MockUpstreamTask(subject='a', provider='g', uid='a')
+            raise IOError('Lost connection.')
+        when(self.upstream_repo).all().thenAnswer(upstream)
+        when(self.downstream_repo).all().thenReturn([])
+        when(self.downstream_factory).create_from(other=any()).thenReturn(
+                MockDownstreamTask())
+
+        self.assertRaises(IOError, sync_all, self.execution)
@@ -20,9 +20,14 @@
 from .mocks import MockUpstreamTask
 
 from mockito import mock, when, verify, any
+from tasksync.journal import Journal
 from tasksync.taskwarrior import TaskWarriorTaskFactory, TaskWarriorTaskRepository
 
 import datetime
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 
@@ -80,6 +85,13 @@ class TestTaskWarriorTaskFactory(unittest.TestCase):
         self.assertTrue('tasksync_etag' in task._source)
         self.assertEqual(task.association, 'u')
 
+    def test_associations(self):
+        upstream = MockUpstreamTask(provider='p', uid='u')
+        task = self.factory.create_from(map=TW_TASK_MANAGED)
+        self.assertEqual(task.associations, {})
+        task.associate_with(upstream)
+        self.assertEqual(task.associations, {'p':'u'})
+
     def test_create_from_no_source(self):
         with self.assertRaises(KeyError):
             self.factory.create_from(project=None)
@@ -124,3 +136,93 @@ class TestTaskWarriorTaskRepository(unittest.TestCase):
         self.repository.batch_close(batch)
 
         verify(self.db).task_update(task._source)
+
+    def test_modified_since_filters(self):
+        when(self.db).filter_tasks(
+                {'modified.after':'20010203T040506Z'}).thenReturn([TW_TASK_MANAGED])
+        tasks = self.repository.modified_since(
+                datetime.datetime(2001, 2, 3, 4, 5, 6))
+        self.assertEqual([t.uid for t in tasks], ['1'])
+
+    def test_resource_is_data_location(self):
+        self.db.config = {'data':{'location':'/tmp/./tasks'}}
+        self.assertEqual(self.repository.resource, ('taskwarrior', '/tmp/tasks'))
+        other = TaskWarriorTaskRepository(self.factory, db=mock(),
+                data_location='/tmp/tasks')
+        self.assertEqual(other.resource, self.repository.resource)
+
+    def test_modified_since_reads_journal(self):
+        d = tempfile.mkdtemp()
+        try:
+            journal = Journal(os.path.join(d, 'tasksync.journal'))
+            journal.append(TW_TASK_MANAGED)
+            repository = TaskWarriorTaskRepository(self.factory, db=self.db,
+                    journal=journal.path)
+
+            tasks = repository.modified_since(datetime.datetime(2001, 2, 3))
+            self.assertEqual([t.uid for t in tasks], ['1'])
+            verify(self.db, 0).filter_tasks(any())
+
+            # Changes journaled during the sync are kept.
+            journal.append(dict(TW_TASK_MANAGED, uuid='2'))
+            repository.synced()
+            self.assertEqual(list(journal.read()[0].keys()), ['2'])
+        finally:
+            shutil.rmtree(d)
+
+    def test_get_by_uuid(self):
+        when(self.db).filter_tasks({'or':[('uuid', '1')]}).thenReturn(
+                [TW_TASK_MANAGED])
+        self.assertEqual([t.uid for t in self.repository.get(['1'])], ['1'])
+
+
+class TestBulkTaskWarriorTaskRepository(unittest.TestCase):
+    def setUp(self):
+        self.db = mock()
+        self.factory = TaskWarriorTaskFactory()
+        self.repository = TaskWarriorTaskRepository(
+                self.factory, db=self.db, bulk=True)
+        self.imported = []
+        def import_(command, path):
+            with open(path) as f:
+                self.imported += json.load(f)
+            return ('', '')
+        when(self.db)._execute('import', any()).thenAnswer(import_)
+
+    def test_creates_and_updates_are_imported_once(self):
+        created = self.factory.create_from(map=TW_TASK_UNMANAGED)
+        updated = self.factory.create_from(map=TW_TASK_MANAGED)
+        when(self.db).filter_tasks(any()).thenAnswer(
+                lambda f: [dict(TW_TASK_UNMANAGED, uuid=f['or'][0][1]),
+                    TW_TASK_MANAGED])
+
+        synced = []
+        batch = self.repository.batch_open()
+        self.repository.save(created, batch, lambda t, u: synced.append(t), None)
+        self.repository.save(updated, batch, lambda t, u: synced.append(t), None)
+        self.repository.batch_close(batch)
+
+        verify(self.db, 1)._execute('import', any())
+        verify(self.db, 0).task_add(any())
+        verify(self.db, 0).task_update(any())
+        self.assertEqual(len(self.imported), 2)
+        self.assertEqual(self.imported[1]['due'], '20090213T233130Z')
+        self.assertEqual(sorted(t.uid for t in synced),
+                sorted([created.uid, '1']))
+
+    def test_deletes_and_completions_are_bundled(self):
+        done = dict(TW_TASK_MANAGED, end='1234567890')
+        deleted = [dict(TW_TASK_MANAGED, uuid=str(i)) for i in range(0, 3)]
+        when(self.db).filter_tasks(any()).thenReturn([done])
+
+        batch = self.repository.batch_open()
+        self.repository.save(self.factory.create_from(map=done), batch, None, None)
+        for m in deleted:
+            self.repository.delete(self.factory.create_from(map=m), batch,
+                    None, None)
+        self.repository.batch_close(batch)
+
+        verify(self.db)._execute('rc.bulk=0', '1', 'done')
+        verify(self.db)._execute('rc.bulk=0', '0', '1', '2', 'delete')
+        verify(self.db, 0).task_done(any())
+        verify(self.db, 0).task_delete(any())
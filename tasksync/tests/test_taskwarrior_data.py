@@ -0,0 +1,85 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+
+#pylint: disable=C0103,C0111,I0011,I0012,W0704,W0142,W0212,W0232,W0613,W0702
+#pylint: disable=R0201,W0614,R0914,R0912,R0915,R0913,R0904,R0801,W0201,R0902
+from tasksync.taskwarrior import TaskWarriorTaskFactory, TaskWarriorTaskRepository
+from tasksync.taskwarrior_data import TaskWarriorDataReader, parse
+
+import os
+import shutil
+import tempfile
+import unittest
+
+PENDING = (
+    b'[description:"Say \\"hi\\"" due:"1234567890" entry:"1234567890"'
+    b' status:"pending" tags:"a,b" uuid:"1"]\n'
+    b'[description:"Gone" status:"deleted" uuid:"2"]\n'
+    b'[description:"Later" status:"waiting" uuid:"3"]\n')
+
+COMPLETED = (
+    b'[description:"Done" end:"1234567890" status:"completed"'
+    b' tasksync_assoc_googletasks:"g1" tasksync_etag:"&dquot;e&dquot;" uuid:"4"]\n'
+    b'[description:"Local" end:"1234567890" status:"completed" uuid:"5"]\n')
+
+
+class TestParse(unittest.TestCase):
+    def test_parse_record(self):
+        record = parse(PENDING.splitlines()[0])
+        self.assertEqual(record['description'], 'Say "hi"')
+        self.assertEqual(record['due'], '20090213T233130Z')
+        self.assertEqual(record['tags'], ['a', 'b'])
+        self.assertEqual(record['uuid'], '1')
+
+    def test_parse_annotations(self):
+        record = parse(b'[annotation_1234567890:"Note" description:"a"]')
+        self.assertEqual(record['annotations'],
+                [{'entry':'20090213T233130Z', 'description':'Note'}])
+
+    def test_parse_entities(self):
+        record = parse(b'[tasksync_etag:"&dquot;e&dquot;" description:"&open;x&close;"]')
+        self.assertEqual(record['tasksync_etag'], '"e"')
+        self.assertEqual(record['description'], '[x]')
+
+
+class TestTaskWarriorDataReader(unittest.TestCase):
+    def setUp(self):
+        self.data = tempfile.mkdtemp()
+        with open(os.path.join(self.data, 'pending.data'), 'wb') as f:
+            f.write(PENDING)
+        with open(os.path.join(self.data, 'completed.data'), 'wb') as f:
+            f.write(COMPLETED)
+
+    def tearDown(self):
+        shutil.rmtree(self.data)
+
+    def test_tasks_skip_deleted_and_unassociated_completed(self):
+        uuids = [t['uuid'] for t in TaskWarriorDataReader(self.data).tasks()]
+        self.assertEqual(uuids, ['1', '3', '4'])
+
+    def test_missing_and_empty_files(self):
+        os.remove(os.path.join(self.data, 'pending.data'))
+        open(os.path.join(self.data, 'completed.data'), 'w').close()
+        self.assertEqual(list(TaskWarriorDataReader(self.data).tasks()), [])
+
+    def test_repository_reads_data_files(self):
+        repository = TaskWarriorTaskRepository(TaskWarriorTaskFactory(),
+                db=object(), data_location=self.data)
+        tasks = {t.uid:t for t in repository.all()}
+        self.assertEqual(sorted(tasks.keys()), ['1', '3', '4'])
+        self.assertEqual(tasks['4'].association, 'g1')
+        self.assertEqual(tasks['4'].etag, '"e"')
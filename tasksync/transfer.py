@@ -0,0 +1,125 @@
+# Copyright (C) 2012-2018 Richard Burnison
+#
+# This file is part of tasksync.
+#
+# tasksync is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# tasksync is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with tasksync.  If not, see <http://www.gnu.org/licenses/>.
+""" Counts of the bytes an HTTP client sends and receives. """
+from urllib.parse import urlsplit
+
+import http.client
+import httplib2
+import threading
+
+class Transfer(object):
+    """ The bytes sent and received, as they went over the wire. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._received = 0
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def received(self):
+        return self._received
+
+    def add(self, sent=0, received=0):
+        with self._lock:
+            self._sent += sent
+            self._received += received
+
+    def reset(self):
+        """ Start counting again, returning the (sent, received) so far. """
+        with self._lock:
+            counts = (self._sent, self._received)
+            self._sent = 0
+            self._received = 0
+        return counts
+
+class CountingHttp(httplib2.Http):
+    """
+    An httplib2.Http that counts, into a Transfer, the bytes of each request
+    and response, including headers. Responses are counted before they are
+    decompressed.
+    """
+
+    def __init__(self, transfer, **kwargs):
+        super(CountingHttp, self).__init__(**kwargs)
+        self._transfer = transfer
+        self._connection_types = {}
+
+    def request(self, uri, method='GET', body=None, headers=None,
+            redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None):
+        #pylint: disable=W0221
+        if connection_type is None:
+            connection_type = self.__connection_type(urlsplit(uri).scheme)
+        return super(CountingHttp, self).request(uri, method=method, body=body,
+                headers=headers, redirections=redirections,
+                connection_type=connection_type)
+
+    def __connection_type(self, scheme):
+        if not scheme in self._connection_types:
+            self._connection_types[scheme] = _counting(
+                    httplib2.SCHEME_TO_CONNECTION[scheme], self._transfer)
+        return self._connection_types[scheme]
+
+def _counting(connection_type, transfer):
+    """ A subclass of the connection type that counts what goes through it. """
+    class CountingResponse(http.client.HTTPResponse):
+        def __init__(self, sock, *args, **kwargs):
+            http.client.HTTPResponse.__init__(self, sock, *args, **kwargs)
+            self.fp = _CountingReader(self.fp, transfer)
+
+    class CountingConnection(connection_type):
+        response_class = CountingResponse
+
+        def send(self, data):
+            if hasattr(data, '__len__'):
+                transfer.add(sent=len(data))
+            connection_type.send(self, data)
+
+    return CountingConnection
+
+class _CountingReader(object):
+    """ Wraps a response's file, counting the bytes read from it. """
+
+    def __init__(self, fp, transfer):
+        self._fp = fp
+        self._transfer = transfer
+
+    def read(self, *args):
+        data = self._fp.read(*args)
+        self._transfer.add(received=len(data))
+        return data
+
+    def read1(self, *args):
+        data = self._fp.read1(*args)
+        self._transfer.add(received=len(data))
+        return data
+
+    def readline(self, *args):
+        data = self._fp.readline(*args)
+        self._transfer.add(received=len(data))
+        return data
+
+    def readinto(self, b):
+        count = self._fp.readinto(b)
+        self._transfer.add(received=count or 0)
+        return count
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)